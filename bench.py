@@ -0,0 +1,199 @@
+# bench.py: throughput benchmarks for the UCLI plumbing, run against a fake simv so no VCS license is needed
+
+import random
+import subprocess
+import sys
+import time
+import click
+
+from ucli import UCLI
+from decode import Decoder, render
+
+FAKE_LINE = "'b" + "01" * 32 + "\n"
+
+
+def fake_simv(size):
+    """Pretend to be `simv -ucli`: answer every command, replying to `get` with `size` bytes of output"""
+
+    payload = FAKE_LINE * max(1, size // len(FAKE_LINE))
+    out = sys.stdout
+    out.write("ucli% ")
+    out.flush()
+    for line in sys.stdin:
+        cmd = line.strip()
+        # pipelined commands arrive as "puts {marker}; command"
+        if cmd.startswith("puts {") and "}; " in cmd:
+            marker, cmd = cmd[len("puts {"):].split("}; ", 1)
+            out.write(marker + "\n")
+        if cmd == "exit":
+            break
+        elif cmd == "show":
+            out.write("clock\nreset\n")
+        elif cmd == "senv time":
+            out.write("5 ps\n")
+        elif cmd.startswith("get"):
+            out.write(payload)
+        out.write("ucli% ")
+        out.flush()
+
+
+def fake_cmd(size):
+    return f"{sys.executable} {__file__} --fake-simv --size {size}"
+
+
+def legacy_read(size, rounds):
+    """The old reader: one read(1) and one str concat per byte until the prompt shows up"""
+
+    proc = subprocess.Popen(fake_cmd(size).split(), stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+    total = 0
+    start = time.perf_counter()
+    for i in range(rounds + 1):
+        if i > 0:
+            proc.stdin.write(b"get {mem}\n")
+            proc.stdin.flush()
+        line = ""
+        while True:
+            c = proc.stdout.read(1)
+            total += 1
+            if c == b"\n":
+                line = ""
+            else:
+                line += c.decode()
+            if "ucli% " in line:
+                break
+    elapsed = time.perf_counter() - start
+    proc.kill()
+    return total, elapsed
+
+
+def chunked_read(size, rounds):
+    """The current reader, driven through the public UCLI API"""
+
+    ucli = UCLI(fake_cmd(size))
+    ucli.start()
+    total = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        lines = ucli.read("get {mem}", blocking=True, run=True)
+        total += sum(len(line) + 1 for line in lines)
+    elapsed = time.perf_counter() - start
+    ucli.close()
+    return total, elapsed
+
+
+def burst_read(depth, rounds, burst=32):
+    """Time bursts of small commands, like the refresh after every clock step, at a given pipeline depth"""
+
+    ucli = UCLI(fake_cmd(64), pipeline=depth)
+    ucli.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        futures = [ucli.run("senv time") for _ in range(burst)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+    ucli.close()
+    return rounds * burst, elapsed
+
+
+def legacy_decode(var_val):
+    """The old per-signal parsing from SIMVApp.update_variables"""
+
+    if var_val.startswith("'b"):
+        var_val = var_val[2:]
+        if 'x' in var_val or "X" in var_val or "z" in var_val or "Z" in var_val:
+            return str(var_val)
+        try:
+            return hex(int(var_val, 2))
+        except ValueError:
+            return str(var_val)
+    if var_val.startswith("((") and var_val.endswith("))"):
+        tmp_val_dict = {}
+        for sub_var in var_val[2:-2].split(","):
+            sub_var = sub_var.split(" => ")
+            tmp_val_dict[sub_var[0]] = sub_var[1]
+        var_val = ""
+        for key, val in tmp_val_dict.items():
+            if val.startswith("'b"):
+                val = val[2:]
+                if 'x' in val or "X" in val or "z" in val or "Z" in val:
+                    val = str(val)
+                else:
+                    try:
+                        val = hex(int(val, 2))
+                    except ValueError:
+                        val = str(val)
+            var_val += f"{key}: {val}\n"
+        return var_val
+    return str(var_val)
+
+
+def fake_values(width, entries):
+    """A width-bit bus and a memory of entries 64-bit words as `get` prints them, plus the next step's values"""
+
+    bits = lambda n: "".join(random.choice("01") for _ in range(n))
+    words = [bits(64) for _ in range(entries)]
+    values = {"bus": f"'b{bits(width)}", "mem": "((" + ", ".join(f"{i} => 'b{word}" for i, word in enumerate(words)) + "))"}
+    # on the next step the bus changes completely, but only 1% of the memory does
+    for i in random.sample(range(entries), max(1, entries // 100)):
+        words[i] = bits(64)
+    next_values = {"bus": f"'b{bits(width)}", "mem": "((" + ", ".join(f"{i} => 'b{word}" for i, word in enumerate(words)) + "))"}
+    return values, next_values
+
+
+def time_decode(decode, steps, rounds):
+    """Average time to decode and format one value, cycling through steps, after one untimed decode of the last"""
+
+    decode(steps[-1])
+    start = time.perf_counter()
+    for i in range(rounds):
+        decode(steps[i % len(steps)])
+    return (time.perf_counter() - start) / rounds
+
+
+@click.command()
+@click.option("--size", default=4 << 20, help="Bytes of output per `get` response.")
+@click.option("--rounds", default=5, help="Number of `get` round trips to time.")
+@click.option("--legacy/--no-legacy", default=True, help="Also time the old byte-at-a-time reader.")
+@click.option("--depth", default=8, help="Pipeline depth to compare against one command at a time.")
+@click.option("--width", default=1024, help="Bits in the bus decoded by the value decoding benchmark.")
+@click.option("--entries", default=16384, help="64-bit words in the memory decoded by the value decoding benchmark.")
+@click.option("--fake-simv", "as_fake_simv", is_flag=True, hidden=True)
+def cli(size, rounds, legacy, depth, width, entries, as_fake_simv):
+    """Benchmark UCLI stdout throughput against a fake simv emitting multi-megabyte responses."""
+
+    if as_fake_simv:
+        fake_simv(size)
+        return
+
+    readers = [("chunked", chunked_read)]
+    if legacy:
+        readers.append(("legacy", legacy_read))
+
+    for name, reader in readers:
+        total, elapsed = reader(size, rounds)
+        click.echo(f"{name:>8}: {total / elapsed / 2**20:8.2f} MiB/s ({total} bytes in {elapsed:.3f}s)")
+
+    for pipeline in sorted({1, depth}):
+        count, elapsed = burst_read(pipeline, rounds * 20)
+        click.echo(f"depth {pipeline:>2}: {elapsed / count * 1e6:8.1f} us/command ({count} commands in {elapsed:.3f}s)")
+
+    # decoding: the first value of a signal goes through the parser, the next steps reuse its layout
+    # and any elements that didn't change, and an unchanged value is free
+    values, next_values = fake_values(width, entries)
+    for name in values:
+        steps = [values[name], next_values[name]]
+        cases = [
+            ("first", lambda value: render(Decoder().decode(name, value)), steps[:1]),
+            ("step", lambda value, decoder=Decoder(): render(decoder.decode(name, value)), steps),
+            ("same", lambda value, decoder=Decoder(): render(decoder.decode(name, value)), steps[:1]),
+        ]
+        if legacy:
+            cases.append(("legacy", legacy_decode, steps))
+        for case, decode, case_steps in cases:
+            elapsed = time_decode(decode, case_steps, rounds * 2)
+            click.echo(f"{case:>8}: {elapsed * 1e3:8.3f} ms to decode and format {name} ({len(values[name])} bytes)")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,168 @@
+# breakpoints.py: line, signal and time breakpoints, kept in the settings file and installed into simv as stop points
+
+import re
+from collections import OrderedDict
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+BREAKPOINT_KINDS = ("line", "signal", "time")
+# what simv prints when a stop point fires, e.g. "Stop point #3 @ 150 ps;"
+STOP_POINT_RE = re.compile(r"stop point #(\d+)", re.IGNORECASE)
+# file:line, as typed or as clicked in the code view
+LINE_BREAKPOINT_RE = re.compile(r"^(.+):(\d+)$")
+SIGNAL_EQUALS_RE = re.compile(r"^(\S+)\s*==\s*(\S+)$")
+TIME_PREFIX = "@"
+
+
+class Breakpoint():
+    """
+    A source line (target is the path, value the line number), a signal changing or becoming value,
+    or an absolute time in ps. Hits are counted here, simv only knows it by its stop point id.
+    """
+
+    def __init__(self, kind, target, value=None, enabled=True, hits=0):
+        if kind not in BREAKPOINT_KINDS:
+            raise ValueError(f"Unknown breakpoint kind: {kind}")
+        self.kind = kind
+        self.target = target
+        self.value = value
+        self.enabled = enabled
+        self.hits = hits
+        self.stop_id = None # id of its (normally disabled) stop point once installed in simv
+
+    @property
+    def key(self):
+        """Identifies the breakpoint, two breakpoints with the same key are the same one"""
+
+        if self.value is None:
+            return f"{self.kind}:{self.target}"
+        return f"{self.kind}:{self.target}:{self.value}"
+
+    def condition(self):
+        """The (kind, target, value) of the stop point for this breakpoint, see ucli.stop_command"""
+
+        if self.kind == "signal":
+            return ("change", self.target, None) if self.value is None else ("equals", self.target, self.value)
+        return self.kind, self.target, self.value
+
+    def describe(self):
+        if self.kind == "line":
+            return f"{self.target}:{self.value}"
+        if self.kind == "time":
+            return f"{TIME_PREFIX}{self.target} ps"
+        if self.value is None:
+            return self.target
+        return f"{self.target} == {self.value}"
+
+    def to_dict(self):
+        return {"kind": self.kind, "target": self.target, "value": self.value, "enabled": self.enabled}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["kind"], data["target"], data.get("value"), enabled=data.get("enabled", True))
+
+
+def parse_breakpoint(text):
+    """
+    Turn what was typed into a Breakpoint: `@1000` breaks at 1000 ps, `file.sv:42` on a line,
+    `signal == value` when the signal becomes value and a bare signal whenever it changes
+    """
+
+    text = text.strip()
+    if text.startswith(TIME_PREFIX):
+        return Breakpoint("time", int(text[len(TIME_PREFIX):].strip()))
+    match = LINE_BREAKPOINT_RE.match(text)
+    if match:
+        return Breakpoint("line", match.group(1), int(match.group(2)))
+    match = SIGNAL_EQUALS_RE.match(text)
+    if match:
+        return Breakpoint("signal", match.group(1), match.group(2))
+    if not text or " " in text:
+        raise ValueError(f"Not a breakpoint: {text}")
+    return Breakpoint("signal", text)
+
+
+class BreakpointSet():
+    """
+    Every breakpoint, in the order they were added. The set is saved in the settings file under "breakpoints",
+    each one becomes a disabled stop point in simv, and only the enabled ones are armed while resuming,
+    so turning one on or off never touches simv and moving through time never stops on one.
+    """
+
+    def __init__(self, breakpoints=()):
+        self.breakpoints = OrderedDict() # key -> Breakpoint
+        for breakpoint in breakpoints:
+            self.add(breakpoint)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Load the breakpoints saved in the settings file"""
+
+        breakpoints = []
+        for data in settings.get("breakpoints", []):
+            try:
+                breakpoints.append(Breakpoint.from_dict(data))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return cls(breakpoints)
+
+    def save(self, settings):
+        """Put the breakpoints into settings, the caller writes the file"""
+
+        settings["breakpoints"] = [breakpoint.to_dict() for breakpoint in self]
+
+    def __iter__(self):
+        return iter(self.breakpoints.values())
+
+    def __len__(self):
+        return len(self.breakpoints)
+
+    def __contains__(self, key):
+        return key in self.breakpoints
+
+    def get(self, key):
+        return self.breakpoints.get(key)
+
+    def add(self, breakpoint):
+        """Add a breakpoint, returning the one already there if it has the same key"""
+
+        return self.breakpoints.setdefault(breakpoint.key, breakpoint)
+
+    def remove(self, key):
+        """Forget a breakpoint, returning it (or None if there was none with that key)"""
+
+        return self.breakpoints.pop(key, None)
+
+    def lines(self, path):
+        """The line numbers of path with a breakpoint on them, enabled or not"""
+
+        return {breakpoint.value for breakpoint in self if breakpoint.kind == "line" and breakpoint.target == path}
+
+    def armed(self):
+        """Stop point ids of the enabled breakpoints simv has"""
+
+        return [breakpoint.stop_id for breakpoint in self if breakpoint.enabled and breakpoint.stop_id is not None]
+
+    def record_hits(self, output):
+        """Count the breakpoints the output of a run says fired, returning them"""
+
+        by_id = {breakpoint.stop_id: breakpoint for breakpoint in self if breakpoint.stop_id is not None}
+        hit = []
+        for line in output:
+            for stop_id in STOP_POINT_RE.findall(line):
+                breakpoint = by_id.get(stop_id)
+                if breakpoint is not None and breakpoint not in hit:
+                    breakpoint.hits += 1
+                    hit.append(breakpoint)
+        return hit
@@ -0,0 +1,96 @@
+# breakview.py: the breakpoint list, where breakpoints are typed in, switched on and off, and removed
+
+from textual.app import ComposeResult
+from textual.widgets import Static, Input, DataTable
+from textual.message import Message
+from textual.widget import Widget
+from textual.binding import Binding
+
+from rich.text import Text
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+ENABLED_MARK = "●"
+DISABLED_MARK = "○"
+
+
+class BreakpointList(Widget):
+    """One row per breakpoint: enter switches it on or off, delete removes it, and new ones are typed below"""
+
+    BINDINGS = [
+        Binding("delete", "remove", "Remove breakpoint", show=False),
+    ]
+
+    class Add(Message):
+        def __init__(self, text):
+            self.text = text
+            super().__init__()
+
+    class Toggle(Message):
+        def __init__(self, key):
+            self.key = key
+            super().__init__()
+
+    class Remove(Message):
+        def __init__(self, key):
+            self.key = key
+            super().__init__()
+
+    def compose(self) -> ComposeResult:
+        yield Static("No breakpoints", id="breakpoint_header")
+        yield DataTable(id="breakpoint_table", cursor_type="row")
+        yield Input(placeholder="Add a breakpoint: file.sv:42, signal, signal == value or @time", id="breakpoint_input")
+
+    def on_mount(self) -> None:
+        table = self.query_one(DataTable)
+        table.add_column("On", key="enabled")
+        table.add_column("Breakpoint", key="where")
+        table.add_column("Hits", key="hits")
+
+    def show(self, breakpoints) -> None:
+        """Show a BreakpointSet, keeping the cursor on the same row"""
+
+        table = self.query_one(DataTable)
+        row = table.cursor_row
+        # never more than a handful, so they are just listed again
+        table.clear()
+        for breakpoint in breakpoints:
+            hits = str(breakpoint.hits)
+            if breakpoint.stop_id is None:
+                hits = Text("not set", style="dim")
+            table.add_row(
+                ENABLED_MARK if breakpoint.enabled else DISABLED_MARK,
+                Text(breakpoint.describe()),
+                hits,
+                key=breakpoint.key,
+            )
+        if table.row_count:
+            table.move_cursor(row=min(row, table.row_count - 1))
+            self.query_one("#breakpoint_header", Static).update(f"Breakpoints ({table.row_count}):")
+        else:
+            self.query_one("#breakpoint_header", Static).update("No breakpoints")
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        self.post_message(self.Toggle(event.row_key.value))
+
+    def action_remove(self) -> None:
+        table = self.query_one(DataTable)
+        if table.row_count:
+            self.post_message(self.Remove(table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value))
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        event.stop()
+        if event.value.strip():
+            self.post_message(self.Add(event.value))
+            event.input.clear()
@@ -28,9 +28,9 @@ chmod +x tw
 
 # check if --clean flag is passed
 if [[ $* == *--clean* ]]; then
-    pyinstaller --onefile --name debugger --add-data "debugger.tcss:." --add-data "*.toml:." --collect-submodules textual.widgets --collect-all sentry_sdk --add-binary "tw:." --clean main.py
+    pyinstaller --onefile --name debugger --add-data "debugger.tcss:." --add-data "*.toml:." --add-data "hierarchy.tcl:." --collect-submodules textual.widgets --collect-all sentry_sdk --add-binary "tw:." --clean main.py
 else
-    pyinstaller --onefile --name debugger --add-data "debugger.tcss:." --add-data "*.toml:." --collect-submodules textual.widgets --collect-all sentry_sdk --add-binary "tw:." main.py
+    pyinstaller --onefile --name debugger --add-data "debugger.tcss:." --add-data "*.toml:." --add-data "hierarchy.tcl:." --collect-submodules textual.widgets --collect-all sentry_sdk --add-binary "tw:." main.py
 fi
 
 rm tw
@@ -0,0 +1,107 @@
+# cache.py: on-disk cache of the design hierarchy, so a simv that hasn't been rebuilt doesn't have to be listed again
+
+import os
+import json
+import hashlib
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+CACHE_FILE = ".hierarchy_cache.json"
+# bump whenever the format of the cached variables changes
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def simv_stat(path):
+    """Cheap part of the cache key: the size and modification time of the simv binary"""
+
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def simv_hash(path):
+    """Expensive part of the cache key: a hash of the simv binary's contents"""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cache():
+    if os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+    return {}
+
+
+def load_hierarchy(path):
+    """Return the cached (name, type) list for the simv at path, or None if it has never been listed"""
+
+    entry = _load_cache().get(os.path.abspath(path))
+    if entry is None or entry.get("version") != CACHE_VERSION:
+        return None
+    return [tuple(var) for var in entry["variables"]]
+
+
+def hierarchy_is_current(path, force=False):
+    """
+    Check whether the cached hierarchy still matches the simv binary, returning (current, hash).
+    A binary with the size and mtime it was cached with is taken as current without reading it,
+    unless force is set. Otherwise it is hashed, and if only the size or mtime changed (a rebuild
+    that produced the same binary), the cached entry is updated in place and still counts as current.
+    """
+
+    cache = _load_cache()
+    key = os.path.abspath(path)
+    entry = cache.get(key)
+    if entry is None or entry.get("version") != CACHE_VERSION:
+        return False, None
+
+    stat = simv_stat(path)
+    unchanged = stat["size"] == entry.get("size") and stat["mtime"] == entry.get("mtime")
+    if unchanged and not force and entry.get("sha256"):
+        return True, entry["sha256"]
+
+    digest = simv_hash(path)
+    if digest != entry.get("sha256"):
+        return False, digest
+
+    if not unchanged:
+        entry.update(stat)
+        _save_cache(cache)
+    return True, digest
+
+
+def save_hierarchy(path, variables, digest=None):
+    """Store the (name, type) list for the simv at path along with its size, mtime and hash"""
+
+    cache = _load_cache()
+    entry = {"version": CACHE_VERSION, "sha256": digest or simv_hash(path)}
+    entry.update(simv_stat(path))
+    entry["variables"] = [list(var) for var in variables]
+    cache[os.path.abspath(path)] = entry
+    _save_cache(cache)
+
+
+def _save_cache(cache):
+    # write to a temporary file first so a crash never leaves a half written cache behind
+    tmp_file = CACHE_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, CACHE_FILE)
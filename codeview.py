@@ -29,11 +29,19 @@ from textual.validation import Function, Number, ValidationResult, Validator
 from textual.message import Message
 from textual.widget import Widget
 from textual.binding import Binding
+from textual.scroll_view import ScrollView
+from textual.geometry import Size
+from textual.strip import Strip
 
 from rich.syntax import Syntax
+from rich.segment import Segment
+from rich.style import Style
 
 import os
 import json
+import mmap
+from array import array
+from collections import OrderedDict
 
 import sentry_sdk
 
@@ -48,6 +56,206 @@ sentry_sdk.init(
     profiles_sample_rate=1.0,
 )
 
+SOURCE_CACHE_SIZE = 16 # source files kept open (mapped, indexed and partly highlighted)
+HIGHLIGHT_CHUNK = 200 # lines highlighted together the first time any of them is shown
+SYNTAX_THEME = "monokai"
+ACTIVE_LINE_STYLE = Style(bgcolor="grey23", bold=True)
+GUTTER_STYLE = Style(dim=True)
+ACTIVE_MARKER = "=>"
+BREAKPOINT_MARKER = "●"
+BREAKPOINT_STYLE = Style(color="red", bold=True)
+STRIP_CACHE_LINES = 1000 # rendered lines of the current file kept for redrawing
+
+# path -> SourceFile, least recently used first
+source_files = OrderedDict()
+
+
+def lexer_for(path):
+    if path.endswith((".sv", ".svh", ".svi")):
+        return "systemverilog"
+    return "verilog"
+
+
+class SourceFile():
+    """
+    A source file mapped into memory with the offset of every line, so any line is a slice away
+    however big the file is. Lines are highlighted a chunk at a time, the first time they are shown.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            self.data = b""
+
+        # offset of the start of every line, plus the end of the file
+        self.offsets = array("q", [0])
+        position = self.data.find(b"\n")
+        while position != -1:
+            self.offsets.append(position + 1)
+            position = self.data.find(b"\n", position + 1)
+        if self.offsets[-1] != len(self.data):
+            self.offsets.append(len(self.data))
+        self.width = max((self.offsets[i + 1] - self.offsets[i] for i in range(len(self))), default=0)
+
+        self.syntax = Syntax("", lexer_for(path), theme=SYNTAX_THEME, background_color="default")
+        self.chunks = {} # chunk number -> highlighted lines
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, index):
+        """The text of a line (0-based), without its newline"""
+
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def highlighted(self, index):
+        """A line (0-based) as highlighted rich Text"""
+
+        chunk, offset = divmod(index, HIGHLIGHT_CHUNK)
+        lines = self.chunks.get(chunk)
+        if lines is None:
+            first = chunk * HIGHLIGHT_CHUNK
+            last = min(first + HIGHLIGHT_CHUNK, len(self))
+            code = "\n".join(self.line(i) for i in range(first, last))
+            # a block comment open across a chunk boundary is only highlighted from where the chunk starts
+            lines = self.chunks[chunk] = list(self.syntax.highlight(code).split("\n", allow_blank=True))[:last - first]
+        return lines[offset]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+
+def source_file(path):
+    """The SourceFile for path, opened again only if it changed on disk since"""
+
+    mtime = os.stat(path).st_mtime_ns
+    source = source_files.get(path)
+    if source is not None and source.mtime == mtime:
+        source_files.move_to_end(path)
+        return source
+    if source is not None:
+        source.close()
+    source = source_files[path] = SourceFile(path)
+    while len(source_files) > SOURCE_CACHE_SIZE:
+        source_files.popitem(last=False)[1].close()
+    return source
+
+
+class SourceView(ScrollView):
+    """
+    A whole source file with the active line marked, drawn line by line so a step only
+    redraws the lines on screen, however big the file is.
+    """
+
+    class LineClicked(Message):
+        def __init__(self, path, line):
+            self.path = path
+            self.line = line
+            super().__init__()
+
+    def __init__(self, id=None):
+        super().__init__(id=id)
+        self.source = None # SourceFile being shown
+        self.active = None # 1-based line number
+        self.strips = {} # line index -> rendered Strip, for lines that aren't active
+        self.breakpoints = None # BreakpointSet whose line breakpoints are marked
+        self.marked = set() # 1-based line numbers of the file shown with a breakpoint
+
+    def show(self, path, line) -> bool:
+        """Show line of path as the active line, returning False if the file can't be read here"""
+
+        try:
+            source = source_file(path)
+        except OSError:
+            return False
+
+        if source is not self.source:
+            self.source = source
+            self.strips = {}
+            self.marked = self.breakpoints.lines(path) if self.breakpoints is not None else set()
+            self.number_width = len(str(len(source)))
+            self.virtual_size = Size(len(ACTIVE_MARKER) + 1 + self.number_width + 1 + source.width, len(source))
+            self.refresh()
+
+        previous = self.active
+        self.active = line
+        if not self.center():
+            # only the lines the marker moved between change
+            if previous is not None:
+                self.refresh_line(previous - 1)
+            self.refresh_line(line - 1)
+        return True
+
+    def show_breakpoints(self, breakpoints) -> None:
+        """Mark the lines of the file shown that have a breakpoint in breakpoints"""
+
+        self.breakpoints = breakpoints
+        marked = breakpoints.lines(self.source.path) if self.source is not None else set()
+        if marked != self.marked:
+            self.marked = marked
+            self.strips = {}
+            self.refresh()
+
+    def on_click(self, event) -> None:
+        # clicking a line sets (or clears) a breakpoint on it
+        if self.source is None:
+            return
+        line = self.scroll_offset.y + event.y + 1
+        if line <= len(self.source):
+            self.post_message(self.LineClicked(self.source.path, line))
+
+    def center(self, line=None) -> bool:
+        """
+        Scroll line (the active line by default) to the middle, returning whether that scrolled,
+        which redraws whatever comes into view
+        """
+
+        line = line or self.active
+        if line is None:
+            return False
+        top = max(0, line - 1 - self.size.height // 2)
+        if top == self.scroll_offset.y:
+            return False
+        self.scroll_to(y=top, animate=False)
+        return True
+
+    def on_resize(self, event) -> None:
+        # the first file is often shown before the view has a size to center in
+        self.call_after_refresh(self.center)
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.size.width
+        if self.source is None or index >= len(self.source):
+            return Strip.blank(width, self.rich_style)
+
+        if index + 1 == self.active:
+            strip = self._render_source_line(index, ACTIVE_MARKER)
+            strip = strip.extend_cell_length(max(self.virtual_size.width, scroll_x + width)).apply_style(ACTIVE_LINE_STYLE)
+        else:
+            strip = self.strips.get(index)
+            if strip is None:
+                if len(self.strips) >= STRIP_CACHE_LINES:
+                    self.strips.clear()
+                strip = self.strips[index] = self._render_source_line(index, " " * len(ACTIVE_MARKER))
+        return strip.crop(scroll_x, scroll_x + width)
+
+    def _render_source_line(self, index, marker):
+        if index + 1 in self.marked:
+            breakpoint = Segment(BREAKPOINT_MARKER, BREAKPOINT_STYLE)
+        else:
+            breakpoint = Segment(" ")
+        number = Segment(f"{index + 1:>{self.number_width}} ", GUTTER_STYLE)
+        return Strip([Segment(marker, GUTTER_STYLE), breakpoint, number, *self.source.highlighted(index).render(self.app.console, end="")])
+
 
 class CodeWidget(Widget):
 
@@ -58,4 +266,45 @@ class CodeWidget(Widget):
         # return a container with various settings
         # that can be toggled
         with Container():
+            yield Input(placeholder="Go to line", type="integer", id="goto_line")
+            yield SourceView(id="source")
+            # the simulator's own listing, for when the source isn't readable from here
             yield RichLog(classes="code", id="code")
+
+    def on_mount(self) -> None:
+        self.query_one("#code").display = False
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """Scroll to a line of the file being shown, the active line stays where the simulation is"""
+
+        try:
+            self.query_one(SourceView).center(int(event.value))
+        except ValueError:
+            pass
+
+    def show_source(self, path, line) -> bool:
+        """Show the active line in its source file, returning False if the file can't be read here"""
+
+        if not self.query_one(SourceView).show(path, line):
+            return False
+        self.query_one(SourceView).display = True
+        self.query_one("#code").display = False
+        return True
+
+    def show_breakpoints(self, breakpoints) -> None:
+        """Mark the lines with a breakpoint in the source being shown"""
+
+        self.query_one(SourceView).show_breakpoints(breakpoints)
+
+    def show_listing(self, code) -> None:
+        """Show a `listing -active` reply instead of the source"""
+
+        log = self.query_one("#code")
+        log.clear()
+        if isinstance(code, str):
+            log.write(Syntax(code, "verilog"))
+        else:
+            # one highlighting pass for the whole listing rather than one per line
+            log.write(Syntax("\n".join(code), "verilog"))
+        self.query_one(SourceView).display = False
+        log.display = True
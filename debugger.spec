@@ -2,7 +2,7 @@
 from PyInstaller.utils.hooks import collect_submodules
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('debugger.tcss', '.'), ('*.toml', '.')]
+datas = [('debugger.tcss', '.'), ('*.toml', '.'), ('hierarchy.tcl', '.')]
 binaries = [('tw', '.')]
 hiddenimports = []
 hiddenimports += collect_submodules('textual.widgets')
@@ -0,0 +1,453 @@
+# decode.py: turns the values UCLI `get` prints into structured values, formatting them only when shown
+
+from itertools import islice, compress, count
+from operator import itemgetter, ne
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+# parentheses and braces group, commas separate, "=>" follows a struct field (or array index)
+# padding them with spaces lets str.split do the tokenizing, which is much faster than a regex on megabyte values
+SEPARATORS = ("=>", "(", ")", "{", "}", ",")
+LEAF_CACHE_SIZE = 1 << 18 # distinct leaf tokens a Decoder keeps decoded (and formatted) between values
+OPEN = ("(", "{")
+CLOSE = (")", "}")
+PUNCTUATION = ("(", ")", "{", "}", ",", "=>")
+PUNCTUATION_SET = frozenset(PUNCTUATION)
+# how VCS prints the elements of an aggregate with no nesting, like a memory of bit-vectors: ((0 => 'b01, 1 => 'b10))
+FLAT_SEPARATOR = ", "
+FLAT_KEY_SEPARATOR = " => "
+NOT_FLAT = ("(", ")", "{", "}", "\t", "\n") # anything that needs the full parser
+
+
+class Bits():
+    """A 'b bit-vector, kept as its digits until it is formatted in some radix"""
+
+    __slots__ = ("digits", "_radix", "_formatted")
+
+    def __init__(self, digits):
+        self.digits = digits
+        # only the last radix asked for is kept, which is almost always the only one
+        self._radix = None
+        self._formatted = None
+
+    @property
+    def unknown(self):
+        """Whether any bit is x or z"""
+
+        return self.digits.strip("01") != ""
+
+    def format(self, radix="hex"):
+        """The value in radix (hex, dec or bin), or the raw bits if any of them are x or z"""
+
+        if radix != self._radix:
+            # int() refuses x and z, which is cheaper than looking for them first on every element of a memory
+            try:
+                value = int(self.digits, 2)
+            except ValueError:
+                value = None
+            if radix == "bin" or value is None:
+                self._formatted = self.digits
+            elif radix == "dec":
+                self._formatted = str(value)
+            else:
+                self._formatted = hex(value)
+            self._radix = radix
+        return self._formatted
+
+    def __eq__(self, other):
+        return isinstance(other, Bits) and self.digits == other.digits
+
+    def __repr__(self):
+        return f"Bits('b{self.digits})"
+
+
+class Text():
+    """Anything that isn't a bit-vector or an aggregate, shown as it came"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def format(self, radix="hex"):
+        return self.text
+
+    def __eq__(self, other):
+        return isinstance(other, Text) and self.text == other.text
+
+    def __repr__(self):
+        return f"Text({self.text!r})"
+
+
+class Struct(dict):
+    """A struct (or keyed array) literal, field name -> value"""
+
+    rendered = None # radix -> render() output, filled by render
+    lines = None # radix -> render() output line by line, only for values decoded by a FlatLayout
+    base = None # (the value this one was decoded from, positions of the elements that changed) for a FlatLayout
+
+
+class Array(list):
+    """An array literal, one value per element"""
+
+    rendered = None
+    lines = None
+    base = None
+
+
+def leaf(token):
+    """Decode a single atom"""
+
+    if token.startswith("'b") and len(token) > 2:
+        return Bits(token[2:])
+    return Text(token)
+
+
+def tokenize(text):
+    # '{...} assignment patterns group just like braces
+    if "'{" in text:
+        text = text.replace("'{", "{")
+    for separator in SEPARATORS:
+        if separator in text:
+            text = text.replace(separator, f" {separator} ")
+    return text.split()
+
+
+def parse(text):
+    """Decode one `get` result into Bits, Text, Struct or Array values (nested as deep as the literal is)"""
+
+    return _parse(text)[0]
+
+
+def _parse(text):
+    # also returns the tokens of an aggregate, for its Layout
+    text = text.strip()
+    if not text.startswith(OPEN + ("'{",)):
+        return (leaf(text) if text and " " not in text else Text(text)), None
+
+    tokens = tokenize(text)
+    try:
+        value, end = _parse_group(tokens, 0)
+    except IndexError:
+        # unbalanced, so not a literal after all
+        return Text(text), None
+    if end != len(tokens):
+        return Text(text), None
+    return value, tokens
+
+
+def _parse_group(tokens, i):
+    # tokens[i] opens the group, returns (value, index after the closing token)
+    i += 1
+    entries = []
+    while tokens[i] not in CLOSE:
+        if tokens[i] == ",":
+            i += 1
+            continue
+        key = None
+        if tokens[i + 1] == "=>" and tokens[i] not in PUNCTUATION:
+            key = tokens[i]
+            i += 2
+        if tokens[i] in OPEN:
+            value, i = _parse_group(tokens, i)
+        else:
+            value = leaf(tokens[i])
+            i += 1
+        entries.append((key, value))
+    i += 1
+
+    # VCS wraps aggregates in double parentheses
+    if len(entries) == 1 and entries[0][0] is None and isinstance(entries[0][1], (Struct, Array)):
+        return entries[0][1], i
+    if not entries or any(key is not None for key, _ in entries):
+        return Struct((key if key is not None else str(n), value) for n, (key, value) in enumerate(entries)), i
+    return Array(value for _, value in entries), i
+
+
+class Layout():
+    """
+    The shape of a decoded aggregate with its leaves left out, plus where the leaves sit among its tokens,
+    so a later value of the same signal is rebuilt by picking tokens instead of going through the parser.
+    The other tokens (keys and punctuation) are kept too, a later value only fits if it has the same ones.
+    """
+
+    def __init__(self, value, tokens):
+        self.shape = self._shape(value)
+        self.tokens = len(tokens)
+        positions = self._leaf_positions(tokens)
+        if len(positions) != self._count(self.shape):
+            raise ValueError("Leaves don't match the shape of the value")
+        # itemgetter with a single position returns the token itself rather than a tuple
+        self.pick = itemgetter(*positions) if len(positions) > 1 else lambda tokens: [tokens[i] for i in positions]
+        # an aggregate has at least its opening and closing tokens, so this one always returns a tuple
+        leaves = set(positions)
+        self.pick_frame = itemgetter(*(i for i in range(len(tokens)) if i not in leaves))
+        self.frame = self.pick_frame(tokens)
+
+    def _leaf_positions(self, tokens):
+        positions = []
+        for i, token in enumerate(tokens):
+            if token in PUNCTUATION:
+                continue
+            if i + 1 < len(tokens) and tokens[i + 1] == "=>":
+                continue
+            positions.append(i)
+        return positions
+
+    def _shape(self, value):
+        if isinstance(value, Struct):
+            return (Struct, list(value.keys()), [self._shape(child) for child in value.values()])
+        if isinstance(value, Array):
+            return (Array, None, [self._shape(child) for child in value])
+        return None
+
+    def _count(self, shape):
+        if shape is None:
+            return 1
+        return sum(self._count(child) for child in shape[2])
+
+    def fill(self, text, leaf=leaf):
+        """Rebuild a value from text, or None if it doesn't have the tokens of this layout"""
+
+        tokens = tokenize(text)
+        if len(tokens) != self.tokens or self.pick_frame(tokens) != self.frame:
+            return None
+        leaves = self.pick(tokens)
+        if not PUNCTUATION_SET.isdisjoint(leaves):
+            return None
+        return self._build(self.shape, iter(leaves), leaf)
+
+    def _build(self, shape, leaves, leaf):
+        if shape is None:
+            return leaf(next(leaves))
+        kind, keys, children = shape
+        if all(child is None for child in children):
+            values = map(leaf, islice(leaves, len(children)))
+        else:
+            values = [self._build(child, leaves, leaf) for child in children]
+        if kind is Struct:
+            return Struct(zip(keys, values))
+        return Array(values)
+
+
+class FlatLayout():
+    """
+    The layout of an aggregate with no nesting, as VCS prints it, kept as the text of each element.
+    A later value is split into elements with str.split, and only the elements whose text changed are decoded,
+    the rest are the same objects as before (and render only formats the changed ones, see render).
+    """
+
+    def __init__(self, value, prefix, items):
+        self.kind = type(value)
+        self.prefix = prefix # "((" or "(", the suffix is the matching closing parentheses
+        self.keys = list(value.keys()) if self.kind is Struct else None
+        self.items = items # text of each element of the last value
+        self.children = list(value.values()) if self.kind is Struct else list(value)
+        self.value = value
+
+    @classmethod
+    def parse(cls, text, leaf=leaf):
+        """Decode text if it is an aggregate with no nesting printed the way VCS does, returning (value, layout), else None"""
+
+        text = text.strip()
+        if not text.startswith("("):
+            return None
+        inner = cls._inner(text, "((") or cls._inner(text, "(")
+        if not inner:
+            return None
+        prefix = "((" if text.startswith("((") else "("
+        items = inner.split(FLAT_SEPARATOR)
+        # every space, comma and => must be one of the separators, so no key or element has any of them
+        keyed = inner.count(FLAT_KEY_SEPARATOR)
+        if inner.count(",") != len(items) - 1 or inner.count("=>") != keyed:
+            return None
+        if inner.count(" ") != len(items) - 1 + 2 * keyed or "" in items:
+            return None
+        if keyed == 0:
+            value = Array(map(leaf, items))
+        elif keyed == len(items):
+            # keys and elements alternate once every => is a comma, and joining them back must give the same items
+            parts = inner.replace(FLAT_KEY_SEPARATOR, FLAT_SEPARATOR).split(FLAT_SEPARATOR)
+            keys, tokens = parts[0::2], parts[1::2]
+            if len(keys) != len(tokens) or list(map(FLAT_KEY_SEPARATOR.join, zip(keys, tokens))) != items:
+                return None
+            value = Struct(zip(keys, map(leaf, tokens)))
+            if len(value) != len(items):
+                # a key given twice, which the full parser keeps the last of
+                return None
+        else:
+            return None
+        value.lines = {}
+        return value, cls(value, prefix, items)
+
+    @staticmethod
+    def _inner(text, prefix):
+        # the text between the outer parentheses, or None if it has any more grouping
+        suffix = ")" * len(prefix)
+        if not text.startswith(prefix) or not text.endswith(suffix) or len(text) < 2 * len(prefix):
+            return None
+        inner = text[len(prefix):-len(suffix)]
+        if any(char in inner for char in NOT_FLAT):
+            return None
+        return inner
+
+    def fill(self, text, leaf=leaf):
+        """Decode a later value of the signal, or None if it doesn't have this layout"""
+
+        inner = self._inner(text.strip(), self.prefix)
+        if inner is None:
+            return None
+        items = inner.split(FLAT_SEPARATOR)
+        if len(items) != len(self.items):
+            return None
+
+        # elements with the same text as last time were checked back then
+        changed = list(compress(count(), map(ne, items, self.items)))
+        children = list(self.children)
+        for i in changed:
+            token = self._token(i, items[i])
+            if token is None:
+                return None
+            children[i] = leaf(token)
+
+        value = Struct(zip(self.keys, children)) if self.kind is Struct else Array(children)
+        value.lines = {}
+        # only the one before is kept, so decoded values never chain back through every step
+        value.base = (self.value, changed)
+        self.value.base = None
+        self.items = items
+        self.children = children
+        self.value = value
+        return value
+
+    def _token(self, i, item):
+        # the element token of a changed item, if it still has the key and nothing that needs the parser
+        if self.keys is not None:
+            key = self.keys[i] + FLAT_KEY_SEPARATOR
+            if not item.startswith(key):
+                return None
+            item = item[len(key):]
+        if not item or " " in item or "," in item or "=>" in item:
+            return None
+        return item
+
+
+class Decoder():
+    """Decodes `get` results signal by signal, remembering the layout of every aggregate it has seen"""
+
+    def __init__(self):
+        self.layouts = {} # signal -> Layout of its last aggregate value
+        self.last = {} # signal -> (text, value) it last decoded
+        # token -> leaf value, so the elements of a memory that didn't change keep their formatting
+        self.leaves = {}
+
+    def decode(self, name, text):
+        """Decode the value of one signal, reusing the last value (and its formatting) if the text didn't change"""
+
+        last = self.last.get(name)
+        if last is not None and last[0] == text:
+            return last[1]
+
+        value = None
+        layout = self.layouts.get(name)
+        if layout is not None:
+            value = layout.fill(text, self._leaf)
+        if value is None:
+            self.layouts.pop(name, None)
+            # every element is new here, so the leaf cache would only cost a lookup and an insert each
+            flat = FlatLayout.parse(text)
+            if flat is not None:
+                value, self.layouts[name] = flat
+        if value is None:
+            value, tokens = _parse(text)
+            if tokens is not None:
+                try:
+                    self.layouts[name] = Layout(value, tokens)
+                except ValueError:
+                    pass
+        self.last[name] = (text, value)
+        return value
+
+    def _leaf(self, token):
+        value = self.leaves.get(token)
+        if value is None:
+            if len(self.leaves) >= LEAF_CACHE_SIZE:
+                self.leaves.clear()
+            value = self.leaves[token] = leaf(token)
+        return value
+
+    def decode_snapshot(self, values):
+        """Decode a whole {signal: `get` result} snapshot at once"""
+
+        return {name: self.decode(name, text) for name, text in values.items()}
+
+
+def render(value, radix="hex", indent=""):
+    """Format a decoded value for display, one line per field or element of an aggregate"""
+
+    if not indent and isinstance(value, (Struct, Array)):
+        if value.rendered is None:
+            value.rendered = {}
+        if radix not in value.rendered:
+            if value.lines is not None:
+                value.rendered[radix] = "".join(_flat_lines(value, radix))
+            else:
+                value.rendered[radix] = _render(value, radix, indent)
+        return value.rendered[radix]
+    return _render(value, radix, indent)
+
+
+def _flat_lines(value, radix):
+    # the lines of a value from a FlatLayout, copied from the value it was decoded from where the element didn't change
+    lines = value.lines.get(radix)
+    if lines is not None:
+        return lines
+    if not value:
+        lines = ["Empty struct" if isinstance(value, Struct) else "Empty array"]
+    else:
+        keys = list(value.keys()) if isinstance(value, Struct) else [f"[{i}]" for i in range(len(value))]
+        children = list(value.values()) if isinstance(value, Struct) else value
+        base, changed = value.base if value.base is not None else (None, None)
+        base_lines = base.lines.get(radix) if base is not None and base.lines is not None else None
+        if base_lines is not None:
+            lines = list(base_lines)
+            for i in changed:
+                lines[i] = f"{keys[i]}: {children[i].format(radix)}\n"
+        else:
+            lines = [f"{key}: {child.format(radix)}\n" for key, child in zip(keys, children)]
+    value.lines[radix] = lines
+    return lines
+
+
+def _render(value, radix, indent):
+    if isinstance(value, Struct):
+        if not value:
+            return "Empty struct"
+        items = value.items()
+    elif isinstance(value, Array):
+        if not value:
+            return "Empty array"
+        items = ((f"[{i}]", child) for i, child in enumerate(value))
+    else:
+        return value.format(radix)
+
+    lines = []
+    for key, child in items:
+        if not isinstance(child, (Struct, Array)):
+            lines.append(f"{indent}{key}: {child.format(radix)}\n")
+        elif child:
+            lines.append(f"{indent}{key}:\n{_render(child, radix, indent + '  ')}")
+        else:
+            lines.append(f"{indent}{key}: {render(child, radix)}\n")
+    return "".join(lines)
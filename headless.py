@@ -0,0 +1,218 @@
+# headless.py: runs a script of moves, run-untils and dumps against one simv without the TUI, writing the dumps as JSON or CSV,
+# and exports the traces sessions leave on disk
+
+import csv
+import json
+import shlex
+import sys
+
+import click
+
+from ucli import UCLI, CheckpointPolicy, parse_condition, parse_location, DEFAULT_PIPELINE_DEPTH
+from breakpoints import parse_breakpoint
+from search import SignalIndex, GLOB_CHARS, REGEX_PREFIX
+from recording import TraceFile
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+# one step per line, # starts a comment:
+#   clock N            move N clock cycles (negative goes back)
+#   time PS            go to an absolute time in ps
+#   step               step one line
+#   until CONDITION    run until a signal changes, `signal == value` or an expression holds
+#   break BREAKPOINT   set a breakpoint (file.sv:42, signal, signal == value or @time)
+#   continue           run until a breakpoint is hit
+#   dump NAME...       write a row with the values of signals (globs like *rob*.valid and /regex match by name)
+SCRIPT_COMMANDS = ("clock", "time", "step", "until", "break", "continue", "dump")
+CSV_COLUMNS = ["line", "command", "time", "cycle", "location", "hit", "finished"] # followed by every signal dumped
+
+
+class ScriptError(Exception):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def parse_script(text):
+    """Split a script into (line number, command, rest of the line) steps, checking the commands exist"""
+
+    steps = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        command, _, rest = line.partition(" ")
+        if command not in SCRIPT_COMMANDS:
+            raise ScriptError(number, f"unknown command {command}")
+        steps.append((number, command, rest.strip()))
+    return steps
+
+
+class ScriptRunner():
+    """Runs the steps of a script against a started UCLI, collecting a row for every dump, until and continue"""
+
+    def __init__(self, ucli):
+        self.ucli = ucli
+        self.rows = []
+        self.index = None # SignalIndex of every signal, built the first time a dump needs to match names
+
+    def run(self, steps) -> None:
+        for number, command, rest in steps:
+            if self.ucli.stop:
+                raise ScriptError(number, "the simulation has ended")
+            getattr(self, f"_{command}")(number, rest)
+
+    def _clock(self, number, rest):
+        self._moved(number, self.ucli.clock_cycle(self._int(number, rest)))
+
+    def _time(self, number, rest):
+        self._moved(number, self.ucli.set_time(self._int(number, rest)))
+
+    def _step(self, number, rest):
+        self.ucli.step_next()
+
+    def _until(self, number, rest):
+        hit, finished, _ = self.ucli.run_until(*parse_condition(rest))
+        self._row(number, f"until {rest}", hit=hit, finished=finished)
+
+    def _break(self, number, rest):
+        try:
+            breakpoint = self.ucli.add_breakpoint(parse_breakpoint(rest))
+        except ValueError as e:
+            raise ScriptError(number, str(e))
+        if breakpoint.stop_id is None:
+            raise ScriptError(number, f"could not set breakpoint {breakpoint.describe()}")
+
+    def _continue(self, number, rest):
+        hit, finished, _ = self.ucli.resume()
+        self._row(number, "continue", hit=",".join(breakpoint.describe() for breakpoint in hit), finished=finished)
+
+    def _dump(self, number, rest):
+        names = []
+        for name in shlex.split(rest):
+            if name.startswith(REGEX_PREFIX) or any(char in name for char in GLOB_CHARS):
+                if self.index is None:
+                    self.index = SignalIndex(name for name, _ in self.ucli.list_vars())
+                names.extend(self.index.search(name, limit=len(self.index)))
+            else:
+                names.append(name)
+        self._row(number, f"dump {rest}", names=names)
+
+    def _row(self, number, command, names=(), hit=None, finished=None):
+        simtime, location, values = self.ucli.get_snapshot(names)
+        if simtime == -1:
+            raise ScriptError(number, "the simulation has ended")
+        location = parse_location(location)
+        self.rows.append({
+            "line": number,
+            "command": command,
+            "time": simtime,
+            "cycle": simtime // self.ucli.clock_speed if self.ucli.clock_speed else None,
+            "location": f"{location[0]}:{location[1]}" if location else None,
+            "hit": hit,
+            "finished": finished,
+            "values": values,
+        })
+
+    def _moved(self, number, result):
+        success, _ = result
+        if not success:
+            raise ScriptError(number, "can't go there")
+
+    def _int(self, number, rest):
+        try:
+            return int(rest)
+        except ValueError:
+            raise ScriptError(number, f"expected a number, not {rest!r}")
+
+
+def write_rows(rows, out, output_format):
+    """Write the rows of a script run to out, as a JSON list or as CSV with a column per signal"""
+
+    if output_format == "json":
+        json.dump(rows, out, indent=4)
+        out.write("\n")
+        return
+
+    signals = []
+    for row in rows:
+        signals.extend(name for name in row["values"] if name not in signals)
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS + signals)
+    for row in rows:
+        writer.writerow([row[column] for column in CSV_COLUMNS] + [row["values"].get(name, "") for name in signals])
+
+
+def run_headless(cmd, script, output=None, output_format=None, pipeline=DEFAULT_PIPELINE_DEPTH, verbose=False):
+    """Run a script file against the simv command cmd, writing the rows to output (stdout by default). Returns the exit code."""
+
+    if output_format is None:
+        output_format = "csv" if output and output.endswith(".csv") else "json"
+
+    try:
+        with open(script, "r") as f:
+            steps = parse_script(f.read())
+    except (OSError, ScriptError) as e:
+        click.secho(f"Can't read script {script}: {e}", fg="red", err=True)
+        return 2
+
+    ucli = UCLI(cmd, verbose=verbose, pipeline=pipeline, checkpoint_policy=CheckpointPolicy())
+    runner = ScriptRunner(ucli)
+    try:
+        ucli.start()
+    except (FileNotFoundError, ValueError) as e:
+        click.secho(f"Error booting up simv simulation: {e}", fg="red", err=True)
+        ucli.close()
+        return 1
+
+    code = 0
+    try:
+        runner.run(steps)
+    except ScriptError as e:
+        click.secho(f"Script stopped at {e}", fg="red", err=True)
+        code = 1
+    finally:
+        ucli.close()
+
+    # whatever was dumped before a failure is still written
+    if output:
+        with open(output, "w", newline="") as f:
+            write_rows(runner.rows, f, output_format)
+    else:
+        write_rows(runner.rows, sys.stdout, output_format)
+    return code
+
+
+def export_trace(trace_dir, output):
+    """Write every column of a saved trace to an .npz file of NumPy arrays (see TraceFile.to_numpy). Returns the exit code."""
+
+    try:
+        trace = TraceFile(trace_dir)
+    except (OSError, ValueError) as e:
+        click.secho(f"Can't open trace {trace_dir}: {e}", fg="red", err=True)
+        return 2
+
+    try:
+        import numpy as np
+        columns = trace.to_numpy()
+        # one array per signal and field, e.g. "top.count.value" and "top.count.x"
+        np.savez_compressed(output, **{
+            f"{name}.{field}": array for name, fields in columns.items() for field, array in fields.items()
+        })
+    except ImportError as e:
+        click.secho(str(e), fg="red", err=True)
+        return 1
+    finally:
+        trace.close()
+    return 0
@@ -0,0 +1,22 @@
+# hierarchy.tcl: sourced into simv by the debugger so the whole design can be listed in one command
+# every signal is printed as "<marker><name> <type>", instances are walked on the simulator side
+
+proc __sd_list_vars {marker {scope ""}} {
+    if {$scope eq ""} {
+        set entries [show -type]
+    } else {
+        set entries [show -type "$scope.*"]
+    }
+    # the reply is a flat list of names, each followed by its type
+    foreach {name type} $entries {
+        # TODO: where is the "extra" variable coming from?
+        if {$name eq "" || $name eq "extra"} {
+            continue
+        }
+        if {[lindex $type 0] eq "INSTANCE"} {
+            __sd_list_vars $marker $name
+        } else {
+            puts "$marker$name $type"
+        }
+    }
+}
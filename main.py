@@ -1,4 +1,3 @@
-from tui import SIMVApp
 import sys
 import os
 from os import path
@@ -30,6 +29,9 @@ def main(cmd, verbose=False):
     if verbose:
         click.secho("Launching UI...", fg="black")
 
+    # only imported here, so scripted runs never load Textual
+    from tui import SIMVApp
+
     app = SIMVApp(cmd, verbose)
     app.run()
 
@@ -125,14 +127,26 @@ def check_version(check=False):
 @click.option("--web", "-w", is_flag=True, default=False, help="Forward the debugger UI to a public URL.")
 # @click.option("--term", "-t", is_flag=True, default=False, help="Forward the terminal to a public URL. Can be combined with --web.")
 @click.option("--internal-textual", is_flag=True, default=False, help="Do not use this flag manually.")
+@click.option("--script", "-s", type=click.Path(exists=True, dir_okay=False), help="Run a script of steps without the UI.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Where a script writes its results (default stdout).")
+@click.option("--format", "output_format", type=click.Choice(["json", "csv"]), help="Format of the script results (default from --output, else json).")
+@click.option("--export-trace", type=click.Path(exists=True, file_okay=False), help="Export a saved trace directory to NumPy arrays in --output (.npz).")
 @click.argument("command", nargs=-1)
-def cli(verbose, version, update, no_update, command, web, internal_textual):
+def cli(verbose, version, update, no_update, command, web, internal_textual, script, output, output_format, export_trace):
     """Debugger for the simv simulator.
     
     COMMAND is the simv file to run with the debugger, followed by any arguments to pass to the simv executable. It can be omitted if you want to run the debugger without a simv executable.
 
     Example:
     debugger ./build/test1.simv +MEMORY=programs/mem/test_1.mem +OUTPUT=output/test
+
+    With --script, the steps in the script are run against COMMAND with no UI, and every dump is
+    written out as JSON or CSV (see headless.py for the steps):
+    debugger --script probe.txt -o out/test_1.csv ./build/test1.simv +MEMORY=programs/mem/test_1.mem
+
+    Every session keeps a trace of the watched values in a directory under .trace, which --export-trace
+    turns into NumPy arrays (needs numpy):
+    debugger --export-trace .trace/test1.simv-20250101-120000-4242 -o test_1.npz
     """
 
     term = False
@@ -159,6 +173,22 @@ def cli(verbose, version, update, no_update, command, web, internal_textual):
         main(cmd, verbose)
 
     check_version(version)
+
+    if export_trace:
+        from headless import export_trace as export
+
+        sys.exit(export(export_trace, output or export_trace.rstrip("/") + ".npz"))
+
+    if script:
+        # batch runs never prompt for updates or touch the settings file
+        if len(command) == 0:
+            click.secho("A script needs a simv executable to run against", fg="red")
+            sys.exit(2)
+        from headless import run_headless
+
+        cmd = " ".join(command) + " -ucli -suppress=ASLR_DETECTED_INFO -ucli2Proc"
+        sys.exit(run_headless(cmd, script, output, output_format, verbose=verbose))
+
     updater(update, not no_update, verbose)
 
     cmd = None
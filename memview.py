@@ -0,0 +1,169 @@
+# memview.py: a scrolling window onto a large memory that only ever fetches the addresses on screen
+
+import re
+from collections import OrderedDict
+
+from textual.scroll_view import ScrollView
+from textual.geometry import Size
+from textual.strip import Strip
+
+from rich.segment import Segment
+from rich.style import Style
+
+from settings import Globals
+from decode import Decoder, Struct, Array, render
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+PAGE_SIZE = 64 # elements fetched by one ranged get
+PREFETCH_PAGES = 2 # pages fetched on each side of the visible ones, so scrolling rarely waits on simv
+PAGE_CACHE_SIZE = 512 # decoded pages kept across every time visited
+MEMORY_VIEW_THRESHOLD = 256 # arrays with more elements than this get a MemoryView instead of a plain value
+
+# the unpacked range of an array as `show -type` prints it, e.g. "ARRAY [0:65535] ..." or "MDA [255:0] ..."
+ARRAY_RANGE_RE = re.compile(r"\b(?:ARRAY|MDA)\b\W*\[\s*(-?\d+)\s*:\s*(-?\d+)\s*\]", re.IGNORECASE)
+
+
+def memory_range(var_type):
+    """The (left, right) bounds of an unpacked array type as declared, or None if var_type isn't an array"""
+
+    match = ARRAY_RANGE_RE.search(var_type or "")
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def is_memory(var_type, threshold=None):
+    """Whether a signal of var_type is big enough to be shown in a MemoryView"""
+
+    if threshold is None:
+        threshold = Globals().settings.get("memory_view_threshold", MEMORY_VIEW_THRESHOLD)
+    bounds = memory_range(var_type)
+    return bounds is not None and abs(bounds[0] - bounds[1]) + 1 > threshold
+
+
+class MemoryView(ScrollView):
+    """
+    One line per element of a memory, drawn line by line as it scrolls into view.
+    Elements are fetched a page at a time with ranged gets and cached by simulation time,
+    and the pages around the visible ones are prefetched in the background.
+    """
+
+    def __init__(self, var, bounds, id=None, classes=None) -> None:
+        super().__init__(id=id, classes=classes)
+        self.var = var
+        self.left, self.right = bounds
+        self.low = min(bounds)
+        self.count = abs(self.left - self.right) + 1
+        self.address_width = len(f"{max(abs(self.left), abs(self.right)):x}")
+
+        self.time = None # the simulation time being shown, nothing is fetched until it is known
+        self.pages = OrderedDict() # (time, page) -> rendered elements, least recently used first
+        self.pending = set() # (time, page) being fetched
+        self.decoder = Decoder()
+
+        self.virtual_size = Size(0, self.count)
+
+    def show_time(self, simtime, exact=True) -> None:
+        """
+        Show the memory at simtime. If the time isn't exact (after stepping a line, values can change
+        without time moving), whatever was cached at simtime is fetched again.
+        """
+
+        if not exact:
+            for key in [key for key in self.pages if key[0] == simtime]:
+                del self.pages[key]
+        self.time = simtime
+        self.refresh()
+
+    def _page_command(self, page):
+        # the bounds of page in the order the array is declared, so simv returns it without complaint
+        first = self.low + page * PAGE_SIZE
+        last = min(first + PAGE_SIZE, self.low + self.count) - 1
+        if self.left > self.right:
+            return last, first
+        return first, last
+
+    def _page(self, page):
+        key = (self.time, page)
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+        self._request([page])
+        return None
+
+    def _request(self, pages) -> None:
+        # fetch pages at the current time, visible ones first, then the ones around them
+        if self.time is None or Globals().ucli is None:
+            return
+        pages = [page for page in pages if (self.time, page) not in self.pages and (self.time, page) not in self.pending]
+        if not pages:
+            return
+        last_page = (self.count - 1) // PAGE_SIZE
+        for page in list(pages):
+            for offset in range(1, PREFETCH_PAGES + 1):
+                for neighbour in (page + offset, page - offset):
+                    key = (self.time, neighbour)
+                    if 0 <= neighbour <= last_page and neighbour not in pages and key not in self.pages and key not in self.pending:
+                        pages.append(neighbour)
+        self.pending.update((self.time, page) for page in pages)
+        self.run_worker(self._load(self.time, pages), group=f"memory_view_{id(self)}", exit_on_error=False)
+
+    async def _load(self, simtime, pages) -> None:
+        try:
+            for page in pages:
+                first, last = self._page_command(page)
+                text = await Globals().ucli.get_range(self.var, first, last, at=simtime)
+                if text is None:
+                    # a step got in first, so the rest would be read at some other time too
+                    return
+                self._store(simtime, page, text)
+                if simtime == self.time:
+                    self.refresh()
+        finally:
+            self.pending.difference_update((simtime, page) for page in pages)
+
+    def _store(self, simtime, page, text) -> None:
+        value = self.decoder.decode(f"{self.var}[{page}]", text)
+        if isinstance(value, Struct):
+            # keyed by address already
+            elements = list(value.values())
+        elif isinstance(value, Array):
+            elements = list(value)
+        else:
+            # simv didn't return an aggregate (an error, most likely), so show it on the first line of the page
+            elements = [value]
+        if self.left > self.right:
+            elements.reverse()
+        self.pages[(simtime, page)] = [render(element).rstrip("\n").replace("\n", "  ") for element in elements]
+        while len(self.pages) > PAGE_CACHE_SIZE:
+            self.pages.popitem(last=False)
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        index = scroll_y + y
+        width = self.size.width
+        if index >= self.count:
+            return Strip.blank(width, self.rich_style)
+
+        page, offset = divmod(index, PAGE_SIZE)
+        elements = self._page(page)
+        address = Segment(f"{self.low + index:0{self.address_width}x}: ", Style(dim=True))
+        if elements is None:
+            value = Segment("...", Style(dim=True))
+        elif offset < len(elements):
+            value = Segment(elements[offset])
+        else:
+            value = Segment("")
+        return Strip([address, value]).crop(scroll_x, scroll_x + width).simplify()
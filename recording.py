@@ -0,0 +1,376 @@
+# recording.py: watched signals recorded cycle by cycle, in memory or in a columnar trace on disk
+
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+
+class Trace():
+    """
+    The values of a fixed set of signals (and the code listing) at every recorded time, in ps.
+    Values are stored per time as a {name: value} dict, using the same names as the UCLI value cache,
+    so the code listing lives under its listing command.
+    """
+
+    def __init__(self, signals):
+        self.signals = list(signals)
+        self.times = [] # recorded times, increasing
+        self.values = [] # {name: value} for each entry in times
+
+    @property
+    def start(self):
+        return self.times[0] if self.times else None
+
+    @property
+    def end(self):
+        return self.times[-1] if self.times else None
+
+    def append(self, time, values):
+        """Add the values captured at time, which must be later than anything recorded so far"""
+
+        if self.times and time <= self.times[-1]:
+            raise ValueError(f"Trace times must increase, got {time} after {self.times[-1]}")
+        self.times.append(time)
+        self.values.append(values)
+
+    def _index(self, time):
+        i = bisect.bisect_left(self.times, time)
+        if i < len(self.times) and self.times[i] == time:
+            return i
+        return None
+
+    def covers(self, time):
+        """Whether something was recorded at exactly this time"""
+
+        return self._index(time) is not None
+
+    def lookup(self, time, names):
+        """Split names into a dict of the recorded values at time and a list of the missing ones"""
+
+        i = self._index(time)
+        if i is None:
+            return {}, list(names)
+
+        found = {}
+        missing = []
+        for name in names:
+            if name in self.values[i]:
+                found[name] = self.values[i][name]
+            else:
+                missing.append(name)
+        return found, missing
+
+    def __len__(self):
+        return len(self.times)
+
+
+TRACE_VERSION = 1
+DEFAULT_TRACE_DIR = ".trace" # every session writes its own trace directory in here, see session_trace_path (None turns traces off)
+DEFAULT_TRACE_RETENTION = 20 # session trace directories kept in the trace directory, the oldest are removed first
+TIME_COLUMN = "time.col"
+META_FILE = "meta.json"
+ROW_FORMAT = "q" # native 64 bit signed ints for times and text offsets
+ROW_SIZE = struct.calcsize(ROW_FORMAT)
+
+# VCS 4-state digits as (aval, bval) bit planes, the same encoding VPI uses: 0 = (0, 0), 1 = (1, 0), z = (0, 1), x = (1, 1)
+AVAL_DIGITS = str.maketrans("01xXzZ", "011100")
+BVAL_DIGITS = str.maketrans("01xXzZ", "001111")
+DIGITS = {(0, 0): "0", (1, 0): "1", (0, 1): "z", (1, 1): "x"}
+
+
+def session_trace_path(trace_dir, simv):
+    """A new trace directory in trace_dir for a session of simv, named after it and when (and by which process) it started"""
+
+    name = os.path.basename(simv) or "simv"
+    return os.path.join(trace_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+
+def prune_traces(trace_dir, keep=DEFAULT_TRACE_RETENTION):
+    """
+    Remove all but the keep most recently written session traces in trace_dir (None keeps them all).
+    The newest is always kept, since its session is most likely still writing it.
+    Only directories holding a trace are counted or removed, anything else in trace_dir is left alone.
+    """
+
+    if keep is None or not os.path.isdir(trace_dir):
+        return
+    traces = []
+    for entry in os.scandir(trace_dir):
+        meta = os.path.join(entry.path, META_FILE)
+        if entry.is_dir(follow_symlinks=False) and os.path.exists(meta):
+            traces.append((os.path.getmtime(meta), entry.path))
+    traces.sort(reverse=True)
+    for _, path in traces[max(keep, 1):]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def is_bits(value):
+    """Whether value is a plain 'b bit-vector that fits a packed column"""
+
+    return value.startswith("'b") and len(value) > 2 and not value[2:].strip("01xXzZ")
+
+
+def encode_bits(value, width):
+    """Pack a 'b value into aval + bval bytes, or all x if it isn't a bit-vector of this width"""
+
+    nbytes = (width + 7) // 8
+    digits = value[2:] if is_bits(value) else ""
+    if len(digits) != width:
+        ones = ((1 << width) - 1).to_bytes(nbytes, "big")
+        return ones + ones
+    aval = int(digits.translate(AVAL_DIGITS), 2)
+    bval = int(digits.translate(BVAL_DIGITS), 2)
+    return aval.to_bytes(nbytes, "big") + bval.to_bytes(nbytes, "big")
+
+
+def decode_bits(row, width):
+    """Turn aval + bval bytes from encode_bits back into the 'b value"""
+
+    nbytes = len(row) // 2
+    aval = int.from_bytes(row[:nbytes], "big")
+    bval = int.from_bytes(row[nbytes:], "big")
+    if bval == 0:
+        return "'b" + format(aval, f"0{width}b")
+    return "'b" + "".join(
+        DIGITS[int(a), int(b)] for a, b in zip(format(aval, f"0{width}b"), format(bval, f"0{width}b"))
+    )
+
+
+class TraceWriter():
+    """
+    Appends rows of watched values to a columnar trace directory as the debugger visits new times.
+    Times go to one column of 64 bit ints. Every bit-vector signal gets a column of fixed size rows
+    holding its aval and bval bit planes (see encode_bits), so x and z cost two bits per bit in total.
+    Anything else (structs, arrays, errors) gets a text column: the utf-8 values back to back plus the end
+    offset of each. A signal first seen part way through starts its column at that row, recorded in meta.json.
+    Only times later than the last row are written, so going back and forth never duplicates rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # every session gets its own directory, so one that already has a trace belongs to someone else
+        if os.path.exists(os.path.join(path, META_FILE)):
+            raise FileExistsError(f"{path} already has a trace")
+        self.signals = [] # meta.json entries, in column order
+        self.columns = {} # name -> (meta entry, column files)
+        self.rows = 0
+        self.last_time = None
+        self.time_file = open(os.path.join(path, TIME_COLUMN), "wb")
+        self._save_meta()
+
+    def append(self, time, values):
+        """Add a row of {name: value} captured at time, returning False if time isn't new"""
+
+        if self.last_time is not None and time <= self.last_time:
+            return False
+
+        for name, value in values.items():
+            if name not in self.columns:
+                self._add_column(name, value)
+        for name, (meta, files) in self.columns.items():
+            value = values.get(name, "")
+            if meta["kind"] == "bits":
+                files[0].write(encode_bits(value, meta["width"]))
+            else:
+                data = value.encode()
+                meta["length"] += len(data)
+                files[0].write(data)
+                files[1].write(struct.pack(ROW_FORMAT, meta["length"]))
+        # the time goes last, so a row is only there once all of its values are
+        self.time_file.write(struct.pack(ROW_FORMAT, time))
+        self.rows += 1
+        self.last_time = time
+        return True
+
+    def flush(self):
+        for meta, files in self.columns.values():
+            for f in files:
+                f.flush()
+        self.time_file.flush()
+
+    def close(self):
+        self.flush()
+        for meta, files in self.columns.values():
+            for f in files:
+                f.close()
+        self.time_file.close()
+
+    def _add_column(self, name, value):
+        base = os.path.join(self.path, str(len(self.signals)))
+        if is_bits(value):
+            meta = {"name": name, "kind": "bits", "width": len(value) - 2, "first_row": self.rows}
+            files = (open(base + ".col", "wb"),)
+        else:
+            meta = {"name": name, "kind": "text", "first_row": self.rows}
+            files = (open(base + ".txt", "wb"), open(base + ".off", "wb"))
+            meta["length"] = 0
+        self.signals.append(meta)
+        self.columns[name] = (meta, files)
+        self._save_meta()
+
+    def _save_meta(self):
+        # written to a temporary file first, like the hierarchy cache
+        meta = {
+            "version": TRACE_VERSION,
+            "signals": [{key: value for key, value in signal.items() if key != "length"} for signal in self.signals],
+        }
+        tmp_file = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, os.path.join(self.path, META_FILE))
+
+
+class TraceFile():
+    """
+    A trace directory written by TraceWriter, opened with mmap so only the pages being looked at are read.
+    It answers covers and lookup like a Trace, so it can stand in for a recorded window.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {meta.get('version')} in {path}")
+
+        self._maps = []
+        self.times = self._map_rows(TIME_COLUMN)
+        self.columns = {}
+        for i, signal in enumerate(meta["signals"]):
+            if signal["kind"] == "bits":
+                self.columns[signal["name"]] = (signal, self._map(f"{i}.col"), None)
+            else:
+                self.columns[signal["name"]] = (signal, self._map(f"{i}.txt"), self._map_rows(f"{i}.off"))
+        self.signals = list(self.columns)
+
+    def _map(self, name):
+        with open(os.path.join(self.path, name), "rb") as f:
+            # mmap can't map an empty file, and there is nothing to read from one anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm)
+
+    def _map_rows(self, name):
+        # a row cut short by a crash is ignored
+        view = self._map(name)
+        return view[:len(view) // ROW_SIZE * ROW_SIZE].cast(ROW_FORMAT)
+
+    @property
+    def start(self):
+        return self.times[0] if len(self.times) else None
+
+    @property
+    def end(self):
+        return self.times[-1] if len(self.times) else None
+
+    def __len__(self):
+        return len(self.times)
+
+    def _index(self, time):
+        i = bisect.bisect_left(self.times, time)
+        if i < len(self.times) and self.times[i] == time:
+            return i
+        return None
+
+    def covers(self, time):
+        """Whether something was recorded at exactly this time"""
+
+        return self._index(time) is not None
+
+    def value(self, name, row):
+        """The value of name in a row, or None if it wasn't being traced then"""
+
+        meta, data, offsets = self.columns[name]
+        i = row - meta["first_row"]
+        if i < 0:
+            return None
+        if meta["kind"] == "bits":
+            size = 2 * ((meta["width"] + 7) // 8)
+            if (i + 1) * size > len(data):
+                return None
+            return decode_bits(data[i * size:(i + 1) * size], meta["width"])
+        if i >= len(offsets):
+            return None
+        start = offsets[i - 1] if i > 0 else 0
+        return bytes(data[start:offsets[i]]).decode()
+
+    def lookup(self, time, names):
+        """Split names into a dict of the recorded values at time and a list of the missing ones"""
+
+        row = self._index(time)
+        found = {}
+        missing = []
+        for name in names:
+            value = self.value(name, row) if row is not None and name in self.columns else None
+            if value is None:
+                missing.append(name)
+            else:
+                found[name] = value
+        return found, missing
+
+    def to_numpy(self, names=None):
+        """
+        Export columns as NumPy arrays for offline analysis: {name: {"time", "value", "x", "z"}}.
+        Bit-vector values and masks are (rows, bytes) uint8 arrays, most significant byte first;
+        text columns only have "time" and an object array of strings under "value".
+        """
+
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("Exporting a trace to NumPy arrays needs numpy, install it with `pip install numpy`")
+
+        # copied, like every other array here, so they outlive close()
+        times = np.frombuffer(self.times, dtype=np.int64).copy() if len(self.times) else np.zeros(0, dtype=np.int64)
+        arrays = {}
+        for name in names or self.signals:
+            meta, data, offsets = self.columns[name]
+            first = meta["first_row"]
+            if meta["kind"] == "bits":
+                nbytes = (meta["width"] + 7) // 8
+                rows = min(len(data) // (2 * nbytes), len(times) - first)
+                planes = np.frombuffer(data, dtype=np.uint8, count=rows * 2 * nbytes).reshape(rows, 2, nbytes)
+                aval, bval = planes[:, 0, :], planes[:, 1, :]
+                arrays[name] = {
+                    "time": times[first:first + rows],
+                    "value": aval & ~bval,
+                    "x": aval & bval,
+                    "z": ~aval & bval,
+                }
+            else:
+                rows = min(len(offsets), len(times) - first)
+                values = np.empty(rows, dtype=object)
+                for i in range(rows):
+                    values[i] = self.value(name, first + i)
+                arrays[name] = {"time": times[first:first + rows], "value": values}
+        return arrays
+
+    def close(self):
+        self.times.release()
+        for meta, data, offsets in self.columns.values():
+            data.release()
+            if offsets is not None:
+                offsets.release()
+        for mm in self._maps:
+            mm.close()
+        self._maps = []
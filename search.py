@@ -0,0 +1,137 @@
+# search.py: finds signals by name for the watch picker, fast enough to run as the user types on designs with 100K+ signals
+
+import re
+import fnmatch
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import chain, islice
+
+import sentry_sdk
+
+sentry_sdk.init(
+    dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
+    # Set traces_sample_rate to 1.0 to capture 100%
+    # of transactions for tracing.
+    traces_sample_rate=1.0,
+    # Set profiles_sample_rate to 1.0 to profile 100%
+    # of sampled transactions.
+    # We recommend adjusting this value in production.
+    profiles_sample_rate=1.0,
+)
+
+SEARCH_LIMIT = 200 # most results shown in the picker
+SEARCH_DEBOUNCE = 0.15 # seconds of no typing before a search runs
+GLOB_CHARS = ("*", "?")
+REGEX_PREFIX = "/"
+
+
+def segments(name):
+    """The lower-cased path segments of a hierarchical name, without array indices"""
+
+    return [segment.split("[", 1)[0] for segment in name.lower().split(".")]
+
+
+class SignalIndex():
+    """
+    Every signal name joined into one lower-cased string, so substring matches are found by str.find
+    instead of a Python loop, plus sorted indexes of leaf names and path segments for prefix matches.
+    Names are numbered shortest first, so every list of matches is already in the order it is shown.
+    Plain queries are ranked, globs (*rob*.valid) match whole names and /regex searches anywhere.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names, key=lambda name: (len(name), name))
+        self.alphabetical = sorted(self.names)
+        self.blob = "\n".join(self.names).lower()
+        # offset of every name in blob, to turn a match position back into a name
+        self.starts = []
+        offset = 0
+        for name in self.names:
+            self.starts.append(offset)
+            offset += len(name) + 1
+
+        by_leaf = {}
+        by_segment = {}
+        for i, name in enumerate(self.names):
+            parts = segments(name)
+            by_leaf.setdefault(parts[-1], []).append(i)
+            for part in set(parts[:-1]):
+                by_segment.setdefault(part, []).append(i)
+        self.leaves = sorted(by_leaf)
+        self.leaf_names = [by_leaf[leaf] for leaf in self.leaves]
+        self.segments = sorted(by_segment)
+        self.segment_names = [by_segment[segment] for segment in self.segments]
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query, limit=SEARCH_LIMIT, exclude=()):
+        """Names matching query, best first, leaving out exclude and stopping at limit"""
+
+        query = query.strip()
+        if not query:
+            return list(islice((name for name in self.alphabetical if name not in exclude), limit))
+        if query.startswith(REGEX_PREFIX):
+            try:
+                pattern = re.compile(query[len(REGEX_PREFIX):], re.IGNORECASE)
+            except re.error:
+                return []
+            return self._matching(pattern.search, None, limit, exclude)
+        if any(char in query for char in GLOB_CHARS):
+            # brackets in a query are array indices, not character classes
+            pattern = re.compile(fnmatch.translate(query.replace("[", "[[]")), re.IGNORECASE)
+            literals = [part for part in re.split(r"[*?]", query.lower()) if part]
+            return self._matching(pattern.match, max(literals, key=len, default=None), limit, exclude)
+        return self._ranked(query.lower(), limit, exclude)
+
+    def _ranked(self, query, limit, exclude):
+        # leaf matches, then other segments starting with query, then query anywhere, shortest first within each
+        tiers = []
+        if "." not in query:
+            tiers.append(self._prefixed(self.leaves, self.leaf_names, query))
+            tiers.append(self._prefixed(self.segments, self.segment_names, query))
+        tiers.append(self._containing(query))
+
+        found = []
+        seen = set()
+        for tier in tiers:
+            for i in tier:
+                if i in seen:
+                    continue
+                seen.add(i)
+                name = self.names[i]
+                if name not in exclude:
+                    found.append(name)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    def _prefixed(self, keys, ids, prefix):
+        # ids of the names under every key starting with prefix, an exact key first, then merged shortest first
+        first = bisect_left(keys, prefix)
+        last = bisect_left(keys, prefix + "\uffff", first)
+        if first < last and keys[first] == prefix:
+            return chain(ids[first], merge(*ids[first + 1:last]))
+        return merge(*ids[first:last])
+
+    def _matching(self, match, literal, limit, exclude):
+        # names the pattern matches, only trying the ones containing literal if there is one
+        candidates = self._containing(literal) if literal else range(len(self.names))
+        found = []
+        for i in candidates:
+            name = self.names[i]
+            if name not in exclude and match(name):
+                found.append(name)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _containing(self, literal):
+        # ids of the names containing literal (already lower case), shortest first
+        position = self.blob.find(literal)
+        while position != -1:
+            i = bisect_right(self.starts, position) - 1
+            yield i
+            # skip to the next name, so each one comes up once
+            next_start = self.starts[i + 1] if i + 1 < len(self.starts) else len(self.blob)
+            position = self.blob.find(literal, next_start)
@@ -9,19 +9,23 @@ from textual.message import Message
 from textual.widget import Widget
 from textual.binding import Binding
 
-from rich.syntax import Syntax
-
 import os
 import json
 import click
 import time
 import sys
+import asyncio
 
 from settings import Globals, SettingsWidget
-from variables import VariableDisplayList, VariableDisplay
+from variables import VariableDisplayList, VariableTree
 from make import MakeTargets, MakeTarget, load_makefile, RunInDebugger
-from codeview import CodeWidget
-from ucli import UCLI
+from codeview import CodeWidget, SourceView
+from breakview import BreakpointList
+from breakpoints import BreakpointSet, Breakpoint, parse_breakpoint
+from recording import DEFAULT_TRACE_DIR, DEFAULT_TRACE_RETENTION, session_trace_path, prune_traces
+from decode import Decoder, render
+from ucli import AsyncUCLI, CheckpointPolicy, listing_command, parse_location, parse_condition, DEFAULT_PIPELINE_DEPTH, DEFAULT_VALUE_CACHE_SIZE, DEFAULT_RECORD_CYCLES
+from cache import load_hierarchy, save_hierarchy, hierarchy_is_current
 
 import sentry_sdk
 
@@ -48,6 +52,17 @@ class ucliData(Message):
         self.error = error
         super().__init__()
 
+class Snapshot():
+    """Everything one refresh shows: the clock, the simulation time, the active source line and the watched values"""
+
+    def __init__(self, simtime, clock, code, values, exact):
+        self.simtime = simtime
+        self.clock = clock
+        self.code = code # reply to LOCATION_COMMAND
+        self.values = values # watched name -> rendered value
+        # False if values can change without simtime moving (after stepping a line)
+        self.exact = exact
+
 class ClockDisplay(Widget):
     clock = reactive("0x0")
     simtime = reactive("0", recompose=True)
@@ -72,6 +87,22 @@ class ClockDisplay(Widget):
     def on_input_submitted(self, event):
         self.post_message(self.Submit(event.value))
 
+class RunUntil(Widget):
+    """Where the condition to run until is typed: a signal, `signal == value` or any Verilog expression"""
+
+    class Submit(Message):
+        def __init__(self, value):
+            self.value = value
+            super().__init__()
+
+    def compose(self) -> ComposeResult:
+        yield Input(placeholder="run until: signal, signal == value or expression", id="run_until_condition")
+
+    def on_input_submitted(self, event):
+        event.stop()
+        if event.value.strip():
+            self.post_message(self.Submit(event.value))
+
 class SIMVApp(App):
     """Textual application for simv debugging"""
 
@@ -85,6 +116,10 @@ class SIMVApp(App):
         Binding("down", "next_clock", "Next clock cycle", show=False),
         Binding("up", "previous_clock", "Previous clock cycle", show=False),
         Binding("n", "next_line", "Next line", show=False),
+        Binding("r", "record", "Record ahead", show=False),
+        Binding("u", "run_until", "Run until", show=False),
+        Binding("c", "resume", "Continue to a breakpoint", show=False),
+        Binding("x", "interrupt", "Interrupt the simulation", show=False),
     ]
 
     def action_help(self):
@@ -96,7 +131,7 @@ class SIMVApp(App):
         else:
             self.action_hide_help_panel()
 
-    def run_ucli(self, cmd):
+    async def run_ucli(self, cmd):
 
         if not os.path.exists(cmd.split()[0]):
             self.post_message(ucliData(msg=f"[red]Executable {cmd.split()[0]} does not exist\n"))
@@ -107,10 +142,23 @@ class SIMVApp(App):
             self.notify(f"Booting up simv simulation...", severity="information", timeout=2)
             self.post_message(ucliData(msg="[dim]Booting up simv simulation...\n"))
 
+        # trace_dir set to null turns the on-disk traces off
+        trace_dir = Globals().settings.get("trace_dir", DEFAULT_TRACE_DIR)
         try:
-            self.ucli = UCLI(cmd)
+            self.ucli = AsyncUCLI(
+                cmd,
+                pipeline=Globals().settings.get("pipeline_depth", DEFAULT_PIPELINE_DEPTH),
+                checkpoint_policy=CheckpointPolicy.from_settings(Globals().settings),
+                value_cache_size=Globals().settings.get("value_cache_size", DEFAULT_VALUE_CACHE_SIZE),
+                trace_path=session_trace_path(trace_dir, cmd.split()[0]) if trace_dir else None,
+                breakpoints=self.breakpoints,
+                timeouts=Globals().settings.get("command_timeouts", None),
+            )
             Globals().ucli = self.ucli
+            await self.ucli.start()
         except (FileNotFoundError, ValueError) as e:
+            if self.ucli:
+                self.ucli.close()
             self.ucli = None
             Globals().ucli = None
             self.notify(f"Error booting up simv simulation: {e}", severity="error", timeout=5)
@@ -131,19 +179,13 @@ class SIMVApp(App):
             # self.exit()
             return
 
-        if self.verbose:
-            self.post_message(ucliData(msg="[dim]Simulation booted.\n"))
-            self.post_message(ucliData(msg="[dim]Starting simulation...\n"))
-
-        try:
-            self.ucli.start()
-        except (FileNotFoundError, ValueError) as e:
-            self.post_message(ucliData(msg=e, error=True))
-            # self.exit()
-            return
-
+        if trace_dir:
+            # this session's trace exists now, so it is never the one removed
+            prune_traces(trace_dir, Globals().settings.get("trace_retention", DEFAULT_TRACE_RETENTION))
         if self.verbose:
             self.post_message(ucliData(msg="[dim]Simulation started.\n"))
+        # the saved breakpoints now have stop points (or couldn't get one)
+        self.post_message(ucliData(cmd="update_breakpoints"))
 
     def __init__(self, cmd, verbose=False):
         super().__init__()
@@ -152,6 +194,16 @@ class SIMVApp(App):
         self.cmd = cmd
         self.ucli = None
         Globals().ucli = None
+        # remembers the layout of every watched struct and array across refreshes
+        self.decoder = Decoder()
+        # the last snapshot shown, so refreshes skip whatever didn't change
+        self.shown_snapshot = None
+        self.watch_list = None
+        # clock cycles asked for by steps that haven't been run yet, and the worker running them
+        self.pending_cycles = 0
+        self.stepper = None
+        # saved in the settings file, and handed to every simulation booted
+        self.breakpoints = BreakpointSet.from_settings(Globals().settings)
 
         self.dark = Globals().settings.get("dark", True)
 
@@ -165,6 +217,9 @@ class SIMVApp(App):
             yield ClockDisplay(id="clock-display")
             yield Button("Clock Next -->", name="next_clock", id="next_clock")
             yield Button("Step Line -->", name="next_line", id="next_line")
+            yield Button("Continue -->", name="resume", id="resume")
+            yield RunUntil(id="run_until")
+            yield Button("Interrupt", name="interrupt", id="interrupt", variant="error")
 
         # check if remember last tab is set
         remember_last_tab = Globals().settings.get("remember_last_tab", True)
@@ -182,7 +237,9 @@ class SIMVApp(App):
                 yield RichLog(highlight=True, markup=True, wrap=True, auto_scroll=True, id="log")
 
             with TabPane("Variables", id="variables-tab"):
-                yield VariableDisplayList(id="variable_list")
+                with Horizontal(id="variables_pane"):
+                    yield VariableTree(id="variable_tree")
+                    yield VariableDisplayList(id="variable_list")
 
             with TabPane("GUI", id="gui-tab"):
                 # TODO
@@ -190,6 +247,7 @@ class SIMVApp(App):
 
             with TabPane("Code", id="code-tab"):
                 yield CodeWidget(id="codeview")
+                yield BreakpointList(id="breakpoints")
 
             with TabPane("Settings", id="settings-tab"):
                 yield SettingsWidget(id="settings")
@@ -220,7 +278,6 @@ class SIMVApp(App):
 
             self.run_worker(
                 self.update_variables,
-                thread=True,
                 exclusive=True,
                 group="update_variables",
             )
@@ -230,33 +287,56 @@ class SIMVApp(App):
             for var in Globals().variables:
                 if var[0] != "extra":
                     self.query_one("#log").write(f"{var[0]}: {var[1]}\n")
-        elif message.cmd == "update_clock":
-            self.query_one(ClockDisplay).clock = message.data
-        elif message.cmd == "update_simtime":
-            self.query_one(ClockDisplay).simtime = message.data
-            Globals().simtime = message.data
-        elif message.cmd is not None and message.cmd.startswith("update_var_"):
-            var_name = message.cmd.split("update_var_")[1]
-            self.query_one(f"#vd_{var_name} .variable_value").update(message.data)
+        elif message.cmd == "update_variable_tree":
+            self.query_one(VariableTree).set_top(message.data)
+        elif message.cmd == "update_snapshot":
+            self.apply_snapshot(message.data)
         elif message.cmd == "update_code":
-            if isinstance(message.data, str):
-                self.query_one("#code").clear()
-                self.query_one("#code").write(Syntax(message.data, "verilog"))
-            else:
-                self.query_one("#code").clear()
-                for line in message.data:
-                    self.query_one("#code").write(Syntax(line, "verilog"))
-
-    def mount_work(self):
+            self.query_one(CodeWidget).show_listing(message.data)
+        elif message.cmd == "update_breakpoints":
+            self.show_breakpoints()
+
+    def show_code(self, location) -> None:
+        """Mark the active line in its source, or fall back to the simulator's listing if the source isn't readable"""
+
+        location = parse_location(location)
+        if location is None or not self.query_one(CodeWidget).show_source(*location):
+            self.run_worker(self.update_code_view, exclusive=True, group="update_code_view")
+
+    def apply_snapshot(self, snapshot) -> None:
+        """Show a refresh in one batch, only touching what changed since the last one"""
+
+        last = self.shown_snapshot
+        with self.batch_update():
+            if last is None or snapshot.clock != last.clock:
+                self.query_one(ClockDisplay).clock = snapshot.clock
+            if last is None or snapshot.simtime != last.simtime:
+                self.query_one(ClockDisplay).simtime = snapshot.simtime
+                Globals().simtime = snapshot.simtime
+            if last is None or snapshot.code != last.code:
+                self.show_code(snapshot.code)
+            self.watch_list.show_values(snapshot.values, snapshot.simtime, snapshot.exact)
+        self.shown_snapshot = snapshot
+
+    async def mount_work(self):
         if self.cmd is not None:
             self.notify(f"Running simv executable `{self.cmd}`...", severity="information", timeout=10)
             self.post_message(ucliData(msg=f"Running simv executable `{self.cmd}`...\n"))
-            self.run_ucli(self.cmd)
+            await self.run_ucli(self.cmd)
             if self.ucli:
-                all_vars = self.ucli.list_vars()
-                sorted_vars = sorted(all_vars, key=lambda x: x[0])
-                Globals().variables = sorted_vars
-                self.post_message(ucliData(cmd="update_variable_list"))
+                # the top level is all the hierarchy browser needs, so show it before listing everything
+                top = await self.ucli.list_scope()
+                self.post_message(ucliData(data=top, cmd="update_variable_tree"))
+
+                simv = self.cmd.split()[0]
+                cached_vars = load_hierarchy(simv)
+                if cached_vars is not None:
+                    # show the cached hierarchy right away and check it against the binary in the background
+                    Globals().variables = cached_vars
+                    self.post_message(ucliData(cmd="update_variable_list"))
+                    self.run_worker(self.revalidate_hierarchy(simv), group="hierarchy")
+                else:
+                    await self.refresh_hierarchy(simv)
                 self.notify(
                     f"VCS setup and ready to use!", severity="information", timeout=2
                 )
@@ -266,6 +346,28 @@ class SIMVApp(App):
         self.notify(f"No simv executable provided", severity="warning", timeout=2)
         self.post_message(ucliData(msg="No simv executable provided", error=True))
 
+    async def refresh_hierarchy(self, simv, digest=None):
+        """List every variable in the design and store the result in the hierarchy cache."""
+        all_vars = await self.ucli.list_vars()
+        sorted_vars = sorted(all_vars, key=lambda x: x[0])
+        # an empty listing means it failed, and caching it would hide the design until simv is rebuilt
+        if sorted_vars:
+            # without a digest from revalidate_hierarchy this hashes the whole binary, so it runs off the event loop too
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, save_hierarchy, simv, sorted_vars, digest)
+        if sorted_vars != Globals().variables:
+            Globals().variables = sorted_vars
+            self.post_message(ucliData(cmd="update_variable_list"))
+
+    async def revalidate_hierarchy(self, simv):
+        """Re-list the design if the simv binary changed since its hierarchy was cached."""
+        # hashing the binary (only needed if its size or mtime changed) is slow enough to keep it off the event loop
+        loop = asyncio.get_running_loop()
+        current, digest = await loop.run_in_executor(None, hierarchy_is_current, simv)
+        if not current and self.ucli:
+            self.post_message(ucliData(msg="[dim]simv changed since its variables were cached, listing them again...\n"))
+            await self.refresh_hierarchy(simv, digest)
+
     def on_mount(self) -> None:
         """Mount the app, click a tab, and update the variables."""
 
@@ -274,11 +376,14 @@ class SIMVApp(App):
 
         # focus tabs
         self.query_one(Tabs).focus()
+        # looked up once, every refresh goes through it
+        self.watch_list = self.query_one(VariableDisplayList)
+        self.show_breakpoints()
 
-        # run the work in a thread
-        self.run_worker(self.mount_work, thread=True)
+        # boot the simulation in the background
+        self.run_worker(self.mount_work)
 
-    def update_variables(self):
+    async def update_variables(self):
         """Update the values of the list of variables being watched."""
         # get variables from ucli
         if self.ucli:
@@ -287,75 +392,28 @@ class SIMVApp(App):
                 self.post_message(ucliData(msg="Simulation has stopped.\n", error=True))
                 return
 
+            # fetch the time, the active source line and every watched variable in one burst
+            # (memories fetch just the part on screen themselves, once they know the time)
+            watched = self.watch_list.watched_names()
+            simtime, code, values = await self.ucli.get_snapshot(watched)
+
             # update the clock cycle
-            try:
-                clock = self.ucli.get_clock()
-                if clock is None or clock == -1:
-                    self.post_message(ucliData(msg="Simulation has ended.\n", error=True))
-                    return
-            except IndexError:
+            if simtime == -1:
                 # simulation has ended
                 self.post_message(ucliData(msg="Simulation has ended.\n", error=True))
                 return
-            self.post_message(ucliData(data=hex(clock), cmd="update_clock"))
-            # update the simulation time
-            simtime = self.ucli.get_time()
-            if simtime == -1:
-                self.post_message(ucliData(msg="Simulation time not available. This probably means you ran past the last clock cycle and the simulation ended.\n", error=True))
-            else:
-                self.post_message(ucliData(data=simtime, cmd="update_simtime"))
-
-            self.update_code_view()
-
-            # update the values of the variables being watched
-            for var in self.query(VariableDisplay):
-                var_name = var.var_name.replace(".", "-dot-").replace("[", "-lbr-").replace("]", "-rbr-").replace('$', '-ds-')
-
-                var_val = self.ucli.get_var(var.var_name)
-
-                if var_val.startswith("'b"):
-                    var_val = var_val[2:]
-                    # catch unintialized values
-                    if 'x' in var_val or "X" in var_val or "z" in var_val or "Z" in var_val:
-                        var_val = str(var_val)
-                    else:
-                        try:
-                            var_val = hex(int(var_val, 2))
-                        except ValueError:
-                            var_val = str(var_val)
-                    self.post_message(ucliData(data=var_val, cmd=f"update_var_{var_name}"))
-                else:
-                    # not a binary value. if not a struct or array, just display the value
-                    if var_val.startswith("((") and var_val.endswith("))"):
-                        var_val = var_val[2:-2]
-                        var_val = var_val.split(",")
-                        tmp_val_dict = {}
-                        for sub_var in var_val:
-                            sub_var = sub_var.split(" => ")
-                            tmp_val_dict[sub_var[0]] = sub_var[1]
-
-                        # if dict is not empty, render table
-                        if tmp_val_dict:
-                            var_val = ""
-                            for key, val in tmp_val_dict.items():
-                                if val.startswith("'b"):
-                                    val = val[2:]
-                                    # catch unintialized values
-                                    if 'x' in val or "X" in val or "z" in val or "Z" in val:
-                                        val = str(val)
-                                    else:
-                                        try:
-                                            val = hex(int(val, 2))
-                                        except ValueError:
-                                            val = str(val)
-                                var_val += f"{key}: {val}\n"
-                        else:
-                            var_val = "Empty struct"
-
-                        self.post_message(ucliData(data=var_val, cmd=f"update_var_{var_name}"))
-                    else:
-                        var_val = str(var_val)
-                        self.post_message(ucliData(data=var_val, cmd=f"update_var_{var_name}"))
+
+            # decode the whole snapshot at once and hand it to the UI as one message,
+            # which only updates the widgets whose text changed
+            decoded = self.decoder.decode_snapshot(values)
+            snapshot = Snapshot(
+                simtime,
+                hex(simtime // self.ucli.clock_speed),
+                code,
+                {name: render(decoded[name]) for name in watched},
+                self.ucli.time is not None,
+            )
+            self.post_message(ucliData(data=snapshot, cmd="update_snapshot"))
 
     def action_toggle_dark(self) -> None:
         """An action to toggle dark mode."""
@@ -373,78 +431,220 @@ class SIMVApp(App):
             self.query_one("#log").write("Simulation exited.\n")
         self.exit()
 
-    def update_code_view(self):
+    async def update_code_view(self):
         if self.ucli:
-            code = self.ucli.get_code()
+            code = await self.ucli.get_code()
             self.post_message(ucliData(data=code, cmd="update_code"))
 
-    def _action_next_clock(self) -> None:
+    def action_next_clock(self) -> None:
+        """An action to go to the next clock cycle."""
+        self.step_clock(1)
+
+    def action_previous_clock(self) -> None:
+        """An action to go to the previous clock cycle."""
+        self.step_clock(-1)
+
+    def step_clock(self, cycles) -> None:
+        """Move cycles clock cycles, merged with any steps still waiting for the simulation (like a held arrow key)."""
+        self.pending_cycles += cycles
+        if self.stepper is None or self.stepper.is_finished:
+            self.stepper = self.run_worker(self._step_clock, exclusive=True, group="ucli_control")
+
+    async def _step_clock(self) -> None:
+        try:
+            backward = False
+            # everything pressed while simv was moving becomes one move, and only where it ends is shown
+            while self.ucli and self.pending_cycles:
+                cycles, self.pending_cycles = self.pending_cycles, 0
+                backward = backward or cycles < 0
+                success, output = await self.ucli.clock_cycle(cycles)
+                if success:
+                    if output != "":
+                        self.post_message(ucliData(msg=output))
+                else:
+                    self.post_message(ucliData(msg=f"Error stepping {cycles:+} clock cycles.\n", error=True))
+        finally:
+            # steps asked for before a cancelled move are dropped with it
+            self.pending_cycles = 0
+
         if self.ucli:
-            success, output = self.ucli.clock_cycle(1)
-            if success:
-                if output != "":
-                    self.post_message(ucliData(msg=output))
-            else:
-                self.post_message(ucliData(msg="Error stepping to next clock cycle.\n", error=True))
+            if backward:
+                self.log_checkpoint_stats()
+            self.run_worker(
+                self.update_variables,
+                exclusive=True,
+                group="update_variables",
+            )
 
+    async def _action_next_line(self) -> None:
+        if self.ucli:
+            await self.ucli.step_next()
             self.run_worker(
                 self.update_variables,
-                thread=True,
                 exclusive=True,
                 group="update_variables",
             )
 
-    def action_next_clock(self) -> None:
-        """An action to go to the next clock cycle."""
-        self.run_worker(self._action_next_clock, thread=True, exclusive=True, group="ucli_control")
+    def action_next_line(self) -> None:
+        """An action to go to the next line."""
+        self.run_worker(self._action_next_line, exclusive=True, group="ucli_control")
 
-    def _action_previous_clock(self) -> None:
+    async def _action_previous_line(self) -> None:
         if self.ucli:
-            success, output = self.ucli.clock_cycle(-1)
-            if success:
-                if output != "":
-                    self.post_message(ucliData(msg=output))
-            else:
-                self.post_message(ucliData(msg="Error stepping to previous clock cycle.\n", error=True))
+            # TODO: needs checkpoint to go back
+            self.run_worker(
+                self.update_variables,
+                exclusive=True,
+                group="update_variables",
+            )
+
+    def action_previous_line(self) -> None:
+        """An action to go to the previous line."""
+        self.run_worker(self._action_previous_line, exclusive=True, group="ucli_control")
+
+    async def _action_record(self) -> None:
+        if self.ucli:
+            cycles = Globals().settings.get("record_cycles", DEFAULT_RECORD_CYCLES)
+            watched = self.watch_list.watched_names()
+            self.post_message(ucliData(msg=f"[dim]Recording the next {cycles} cycles...\n"))
+            # simv's own listing too, so stepping through the recording never needs simv even where the source can't be read
+            output = await self.ucli.record(watched, cycles, listings=[listing_command()])
+            if output:
+                self.post_message(ucliData(msg=output))
+            self.post_message(ucliData(msg=f"Recorded {len(self.ucli.trace) - 1} cycles, stepping inside them won't touch the simulation.\n"))
 
             self.run_worker(
                 self.update_variables,
-                thread=True,
                 exclusive=True,
                 group="update_variables",
             )
 
-    def action_previous_clock(self) -> None:
-        """An action to go to the previous clock cycle."""
-        self.run_worker(self._action_previous_clock, thread=True, exclusive=True, group="ucli_control")
+    def action_record(self) -> None:
+        """An action to record the next cycles of the watched variables."""
+        self.run_worker(self._action_record, exclusive=True, group="ucli_control")
 
-    def _action_next_line(self) -> None:
+    def action_run_until(self) -> None:
+        """An action to type a condition to run until."""
+        self.query_one("#run_until_condition").focus()
+
+    def on_run_until_submit(self, event: RunUntil.Submit) -> None:
+        self.run_worker(self._run_until(event.value), exclusive=True, group="ucli_control")
+
+    async def _run_until(self, condition) -> None:
         if self.ucli:
-            self.ucli.step_next()
+            kind, target, value = parse_condition(condition)
+            self.post_message(ucliData(msg=f"[dim]Running until {condition}...\n"))
+            hit, finished, output = await self.ucli.run_until(
+                kind, target, value, max_cycles=Globals().settings.get("run_until_max_cycles", None)
+            )
+            if output:
+                self.post_message(ucliData(msg=output))
+            if hit:
+                self.post_message(ucliData(msg=f"Stopped at {condition}.\n"))
+            elif finished:
+                self.post_message(ucliData(msg=f"The simulation finished without reaching {condition}.\n", error=True))
+            else:
+                self.post_message(ucliData(msg=f"Ran without reaching {condition}.\n", error=True))
+
+            # one refresh for the whole run
             self.run_worker(
                 self.update_variables,
-                thread=True,
                 exclusive=True,
                 group="update_variables",
             )
 
-    def action_next_line(self) -> None:
-        """An action to go to the next line."""
-        self.run_worker(self._action_next_line, thread=True, exclusive=True, group="ucli_control")
+    def action_interrupt(self) -> None:
+        """An action to break a long run (or a stuck command) back to the simulator prompt."""
+        if self.ucli and self.ucli.interrupt():
+            # whatever was waiting on simv carries on from where it stopped, and refreshes as usual
+            self.post_message(ucliData(msg="[dim]Interrupting the simulation...\n"))
 
-    def _action_previous_line(self) -> None:
+    def action_resume(self) -> None:
+        """An action to run until an enabled breakpoint is hit."""
+        self.run_worker(self._action_resume, exclusive=True, group="ucli_control")
+
+    async def _action_resume(self) -> None:
         if self.ucli:
-            # TODO: needs checkpoint to go back
+            hit, finished, output = await self.ucli.resume(max_cycles=Globals().settings.get("run_until_max_cycles", None))
+            if output:
+                self.post_message(ucliData(msg=output))
+            for breakpoint in hit:
+                self.post_message(ucliData(msg=f"Breakpoint {breakpoint.describe()} hit ({breakpoint.hits} times).\n"))
+            if not hit and finished:
+                self.post_message(ucliData(msg="The simulation finished without hitting a breakpoint.\n"))
+            elif not hit:
+                self.post_message(ucliData(msg="Ran without hitting a breakpoint.\n"))
+            self.post_message(ucliData(cmd="update_breakpoints"))
+
+            # one refresh for the whole run
             self.run_worker(
                 self.update_variables,
-                thread=True,
                 exclusive=True,
                 group="update_variables",
             )
 
-    def action_previous_line(self) -> None:
-        """An action to go to the previous line."""
-        self.run_worker(self._action_previous_line, thread=True, exclusive=True, group="ucli_control")
+    def show_breakpoints(self) -> None:
+        """Show the breakpoints in the list and the code view."""
+        self.query_one(BreakpointList).show(self.breakpoints)
+        self.query_one(CodeWidget).show_breakpoints(self.breakpoints)
+
+    def save_breakpoints(self) -> None:
+        self.breakpoints.save(Globals().settings)
+        Globals().save_settings()
+        self.show_breakpoints()
+
+    def add_breakpoint(self, breakpoint) -> None:
+        """Set a breakpoint, giving it a stop point straight away if a simulation is running."""
+        if breakpoint.key in self.breakpoints:
+            return
+        self.run_worker(self._add_breakpoint(breakpoint), group="breakpoints")
+
+    async def _add_breakpoint(self, breakpoint) -> None:
+        if self.ucli:
+            breakpoint = await self.ucli.add_breakpoint(breakpoint)
+            if breakpoint.stop_id is None:
+                self.post_message(ucliData(msg=f"Could not set breakpoint {breakpoint.describe()}.\n", error=True))
+        else:
+            self.breakpoints.add(breakpoint)
+        self.save_breakpoints()
+
+    def remove_breakpoint(self, key) -> None:
+        self.run_worker(self._remove_breakpoint(key), group="breakpoints")
+
+    async def _remove_breakpoint(self, key) -> None:
+        if self.ucli:
+            await self.ucli.remove_breakpoint(key)
+        else:
+            self.breakpoints.remove(key)
+        self.save_breakpoints()
+
+    def on_breakpoint_list_add(self, message: BreakpointList.Add) -> None:
+        try:
+            self.add_breakpoint(parse_breakpoint(message.text))
+        except ValueError:
+            self.notify(f"Not a breakpoint: {message.text}", severity="warning", timeout=2)
+
+    def on_breakpoint_list_toggle(self, message: BreakpointList.Toggle) -> None:
+        # only armed while resuming, so simv doesn't need to hear about it
+        breakpoint = self.breakpoints.get(message.key)
+        if breakpoint is not None:
+            breakpoint.enabled = not breakpoint.enabled
+            self.save_breakpoints()
+
+    def on_breakpoint_list_remove(self, message: BreakpointList.Remove) -> None:
+        self.remove_breakpoint(message.key)
+
+    def on_source_view_line_clicked(self, message: SourceView.LineClicked) -> None:
+        """Set or clear a breakpoint on the line clicked in the code view."""
+        breakpoint = Breakpoint("line", message.path, message.line)
+        if breakpoint.key in self.breakpoints:
+            self.remove_breakpoint(breakpoint.key)
+        else:
+            self.add_breakpoint(breakpoint)
+
+    def on_variable_display_list_break(self, message: VariableDisplayList.Break) -> None:
+        """Set a breakpoint on a watched variable changing."""
+        self.add_breakpoint(Breakpoint("signal", message.var))
 
     # TODO: can seperate into different functions with @on(Button.Pressed, CSS Selector)?
     def on_button_pressed(self, event: Button.Pressed) -> None:
@@ -456,16 +656,23 @@ class SIMVApp(App):
             self.action_previous_line()
         elif event.button.id == "next_line":
             self.action_next_line()
+        elif event.button.id == "resume":
+            self.action_resume()
+        elif event.button.id == "interrupt":
+            self.action_interrupt()
 
     def on_clock_display_submit(self, event: ClockDisplay.Submit) -> None:
-        # TODO: make this happen in background thread
+        self.run_worker(self._set_time(event.value), exclusive=True, group="ucli_control")
+
+    async def _set_time(self, value) -> None:
         if self.ucli:
             try:
-                target_time = int(event.value)
-                success, output = self.ucli.set_time(target_time)
+                target_time = int(value)
+                success, output = await self.ucli.set_time(target_time)
 
                 if success:
                     self.post_message(ucliData(msg=f"Simulation time set to {target_time} ps.\n"))
+                    self.log_checkpoint_stats()
 
                 if output != "":
                     self.post_message(ucliData(msg=output))
@@ -473,7 +680,6 @@ class SIMVApp(App):
                 if success:
                     self.run_worker(
                         self.update_variables,
-                        thread=True,
                         exclusive=True,
                         group="update_variables",
                     )
@@ -483,6 +689,18 @@ class SIMVApp(App):
                 self.post_message(ucliData(msg="Invalid time format. Please enter a positive integer.\n", error=True))
                 return
 
+    def log_checkpoint_stats(self) -> None:
+        """Write how much going back in time has had to replay to the log."""
+        stats = self.ucli.checkpoint_stats()
+        self.post_message(ucliData(msg=(
+            f"[dim]Checkpoints: {stats['hits']} hits, {stats['misses']} replays from start, "
+            f"{stats['average_replay_cycles']} cycles replayed on average (max {stats['max_replay_cycles']})\n"
+        )))
+
+    def on_variable_tree_watch(self, message: VariableTree.Watch) -> None:
+        """Watch a variable picked from the hierarchy browser."""
+        self.query_one(VariableDisplayList).add_watch(message.var, message.var_type)
+
     def on_make_target_log_data(self, message: MakeTarget.LogData) -> None:
         """Log data from the make target."""
         self.query_one("#log").write(message.data)
@@ -495,7 +713,7 @@ class SIMVApp(App):
 
         self.cmd = event.target + " -ucli -suppress=ASLR_DETECTED_INFO -ucli2Proc"
 
-        self.run_worker(self.mount_work, thread=True)
+        self.run_worker(self.mount_work)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,19 @@
 import subprocess
 import shlex
-import select
-import time
+import os
 import threading
+import asyncio
+import inspect
+import bisect
+import re
+import signal
+from collections import deque, OrderedDict
 import click
 import sentry_sdk
 
+from recording import Trace, TraceWriter
+from breakpoints import BreakpointSet, STOP_POINT_RE
+
 sentry_sdk.init(
     dsn="https://c15cc5692675ac611b7bb01f8eee2d87@o4506596663427072.ingest.us.sentry.io/4508288337903616",
     # Set traces_sample_rate to 1.0 to capture 100%
@@ -17,7 +25,42 @@ sentry_sdk.init(
     profiles_sample_rate=1.0,
 )
 
-BUSY_WAIT_TIME = 0.001
+READ_CHUNK_SIZE = 1 << 16 # bytes pulled from simv stdout per read
+PROMPT = b"ucli% "
+BATCH_MARKER = "@@simv-debugger@@" # prefix for the framing lines printed by batched commands
+SEQ_MARKER = BATCH_MARKER + "SEQ " # echoed in front of every pipelined command's output
+VAR_MARKER = BATCH_MARKER + "VAR " # in front of every signal in a hierarchy dump
+END_MARKER = BATCH_MARKER + "END" # last line of a hierarchy dump that finished
+RUN_MARKER = BATCH_MARKER + "RUN" # in front of the output of each run while recording
+CYCLE_MARKER = BATCH_MARKER + "CYC " # in front of each cycle captured while recording
+LISTING_MARKER = BATCH_MARKER + "LST" # in front of each code listing of a captured cycle, followed by its index
+BREAK_MARKER = BATCH_MARKER + "BRK " # in front of the stop point id of each breakpoint installed
+# the active file and line as a Tcl list, all the code view needs since it reads the sources itself
+LOCATION_COMMAND = "list [senv activeFile] [senv activeLine]"
+DEFAULT_RECORD_CYCLES = 1000
+# Tcl procs sourced into simv at startup, bundled next to this file
+HIERARCHY_TCL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hierarchy.tcl")
+LIST_VARS_COMMAND = (
+    f"if {{[catch {{__sd_list_vars {{{VAR_MARKER}}}}}]}} "
+    f"{{ puts {{{BATCH_MARKER}ERR}} }} else {{ puts {{{END_MARKER}}} }}"
+)
+DEFAULT_PIPELINE_DEPTH = 8
+# commands that move (or fork) the simulation; nothing else is sent until they are done
+# (recording is a Tcl for loop around run)
+PIPELINE_BARRIERS = ("run", "step", "next", "checkpoint", "restart", "config", "exit", "finish", "for")
+DEFAULT_CHECKPOINT_INTERVAL = 100 # clock cycles between checkpoints, 0 leaves it to VCS autocheckpoint
+DEFAULT_CHECKPOINT_BUDGET = 32 # most checkpoints kept alive in simv at once
+DEFAULT_VALUE_CACHE_SIZE = 200000 # (time, signal) values remembered across refreshes
+# seconds a command may take before simv is interrupted, by its first word ("default" for the rest);
+# None waits for as long as it takes, runs can be interrupted by hand instead, and so can the Tcl loops
+# (foreach, if) of the hierarchy dump, batched gets and breakpoint installs, which take as long as the design is big
+DEFAULT_COMMAND_TIMEOUTS = {"default": 120, "run": None, "for": None, "foreach": None, "if": None}
+INTERRUPT_GRACE = 5 # seconds for simv to come back to the prompt after an interrupt before it is given up on
+NO_REPLY = "Error: no reply from the simulation" # value of a signal whose get never came back (simv was shut down)
+# run-until conditions, see parse_condition
+SIGNAL_NAME_RE = re.compile(r"^[\w$.\[\]:]+$")
+FINISH_RE = re.compile(r"\$finish\b") # what simv prints when the design calls $finish
+CONDITION_EQUALS_RE = re.compile(r"^([\w$.\[\]:]+)\s*==\s*(\S+)$")
 
 def convert_time(time_str):
     """Convert a time string to an integer in ps"""
@@ -57,43 +100,596 @@ def convert_time_to_str(time_int):
     # TODO: seems like run command doesn't want a space?
     return f"{time_int}ps"
 
-class UCLI():
-    def __init__(self, cmd, verbose=False):
+def batch_get_command(names):
+    """Build a single Tcl command that gets every signal in names, framing each value with a marker line"""
+
+    signals = " ".join(f"{{{name}}}" for name in names)
+    return (
+        f"foreach __sd_var [list {signals}] {{ "
+        f"if {{[catch {{get $__sd_var}} __sd_val]}} {{ puts \"{BATCH_MARKER}ERR $__sd_var\" }} "
+        f"else {{ puts \"{BATCH_MARKER}VAL $__sd_var\"; puts $__sd_val }} }}"
+    )
+
+def parse_batch_reply(lines):
+    """
+    Split the output of a batch_get_command back into a {name: value} dictionary.
+    Signals the simulator could not get are returned separately as a list of names.
+    """
+
+    values = {}
+    failed = []
+    name = None
+    for line in lines:
+        if line.startswith(BATCH_MARKER):
+            kind, _, name = line[len(BATCH_MARKER):].partition(" ")
+            if kind == "ERR":
+                failed.append(name)
+                name = None
+            else:
+                values[name] = []
+        elif name is not None:
+            values[name].append(line)
+    return {name: "\n".join(value) for name, value in values.items()}, failed
+
+def listing_command(lines=10):
+    """The command for simv's own listing of the lines around the active one"""
+
+    return f"listing -active {lines}"
+
+def record_command(names, cycles, period, listings, capture_first=False):
+    """
+    Build a single Tcl command that runs cycles clock periods of period ps, capturing the output of every
+    code listing command in listings and every signal in names after each one (and once before the first if capture_first)
+    """
+
+    capture = (
+        f"puts \"{CYCLE_MARKER}$__sd_i\"; "
+        + "".join(f"puts {{{LISTING_MARKER}{i}}}; puts [{listing}]; " for i, listing in enumerate(listings))
+        + batch_get_command(names)
+    )
+    return (
+        f"for {{set __sd_i {0 if capture_first else 1}}} {{$__sd_i <= {cycles}}} {{incr __sd_i}} {{ "
+        f"if {{$__sd_i > 0}} {{ puts {{{RUN_MARKER}}}; run -relative {period}ps }}; {capture} }}"
+    )
+
+def parse_record_reply(lines, listings):
+    """
+    Split the output of a record_command into (cycle, {name: value}) tuples, with each code listing
+    stored under its command, and the lines printed by the runs themselves.
+    """
+
+    cycles = []
+    output = []
+    section = output
+    for line in lines:
+        if line == RUN_MARKER:
+            section = output
+        elif line.startswith(CYCLE_MARKER):
+            codes = [[] for _ in listings]
+            batch = []
+            cycles.append((int(line[len(CYCLE_MARKER):]), codes, batch))
+            section = output
+        elif line.startswith(LISTING_MARKER):
+            section = codes[int(line[len(LISTING_MARKER):])]
+        elif line.startswith(BATCH_MARKER):
+            section = batch
+            section.append(line)
+        else:
+            section.append(line)
+
+    captured = []
+    for cycle, codes, batch in cycles:
+        values, _ = parse_batch_reply(batch)
+        for listing, code in zip(listings, codes):
+            # puts adds an empty line if listing printed instead of returning its lines
+            while code and code[-1] == "":
+                code.pop()
+            values[listing] = code
+        captured.append((cycle, values))
+    return captured, output
+
+def parse_location(lines):
+    """Parse the reply to LOCATION_COMMAND into (file, line), or None if simv couldn't say"""
+
+    if not lines:
+        return None
+    path, _, line = " ".join(lines).strip().rpartition(" ")
+    # Tcl braces a path with spaces in it
+    if len(path) >= 2 and path[0] == "{" and path[-1] == "}":
+        path = path[1:-1]
+    try:
+        return path, int(line)
+    except ValueError:
+        return None
+
+def parse_condition(text):
+    """
+    Turn what was typed as a run-until condition into (kind, target, value): a bare signal name stops
+    when it changes, `signal == value` when it becomes value, and anything else is a Verilog expression
+    """
+
+    text = text.strip()
+    match = CONDITION_EQUALS_RE.match(text)
+    if match:
+        return "equals", match.group(1), match.group(2)
+    if SIGNAL_NAME_RE.match(text):
+        return "change", text, None
+    return "expression", text, None
+
+def stop_command(kind, target, value=None):
+    """Build the `stop` command that halts a run when the (kind, target, value) condition from parse_condition holds"""
+
+    if kind == "change":
+        return f"stop -change {{{target}}}"
+    if kind == "equals":
+        return f"stop -condition {{{target} == {value}}}"
+    if kind == "expression":
+        return f"stop -condition {{{target}}}"
+    if kind == "line":
+        return f"stop -file {{{target}}} -line {value}"
+    if kind == "time":
+        return f"stop -absolute {convert_time_to_str(target)}"
+    raise ValueError(f"Unknown stop condition: {kind}")
+
+def parse_stop_id(lines):
+    """Parse the reply to a stop command into the id of the stop point it made, or None if it failed"""
+
+    if command_failed(lines):
+        return None
+    for line in reversed(lines):
+        match = re.search(r"\d+", line)
+        if match:
+            return match.group(0)
+    return None
+
+def install_breakpoints_command(breakpoints):
+    """
+    Build a single Tcl command that makes a disabled stop point for every breakpoint,
+    printing each one's position in breakpoints and its stop point id (or ERR) after BREAK_MARKER
+    """
+
+    commands = []
+    for i, breakpoint in enumerate(breakpoints):
+        commands.append(
+            f"if {{[catch {{{stop_command(*breakpoint.condition())}}} __sd_id]}} {{ puts {{{BREAK_MARKER}{i} ERR}} }} "
+            f"else {{ catch {{stop -disable $__sd_id}}; puts \"{BREAK_MARKER}{i} $__sd_id\" }}"
+        )
+    return "; ".join(commands)
+
+def parse_install_reply(lines, breakpoints):
+    """Give every breakpoint in the reply to install_breakpoints_command its stop point id, returning the ones that failed"""
+
+    failed = []
+    for line in lines:
+        if not line.startswith(BREAK_MARKER):
+            continue
+        index, _, stop_id = line[len(BREAK_MARKER):].partition(" ")
+        breakpoint = breakpoints[int(index)]
+        breakpoint.stop_id = parse_stop_id([stop_id]) if stop_id != "ERR" else None
+        if breakpoint.stop_id is None:
+            failed.append(breakpoint)
+    return failed
+
+def stop_points_command(action, stop_ids):
+    """Build a single Tcl command that enables or disables (action) every stop point in stop_ids"""
+
+    return f"foreach __sd_id {{{' '.join(stop_ids)}}} {{ stop -{action} $__sd_id }}"
+
+def stop_hit(output, stop_id):
+    """Check the output of a run for the message simv prints when stop point stop_id fires"""
+
+    return any(stop_id in STOP_POINT_RE.findall(line) for line in output)
+
+def parse_show_type(lines):
+    """Parse `show -type` output into (name, type, is_instance) tuples, unwrapping generate block names"""
+
+    # TODO: where is the "extra" variable coming from?
+
+    entries = []
+    for line in lines:
+        fields = line.split(" ")
+        name = fields[0]
+        if len(name) >= 3 and name[0] == "{" and name[-1] == "}":
+            name = name[1:-1]
+        if name == "extra" or name == "":
+            continue
+        is_instance = len(fields) > 1 and fields[1] == "{INSTANCE"
+        entries.append((name, " ".join(fields[1:]), is_instance))
+    return entries
+
+def parse_checkpoints(lines):
+    """Parse `checkpoint -list` output into (id, time in ps) tuples"""
+
+    checkpoints = []
+    # the first line is a header
+    for line in lines[1:]:
+        if "Time : " not in line:
+            continue
+        checkpoint_time = line.split("Time : ")[1].split(" Descr : ")[0]
+        checkpoints.append((line.split(":")[0].strip(), convert_time(checkpoint_time)))
+    return checkpoints
+
+def command_failed(lines):
+    """Check the output of a command for a UCLI error message"""
+
+    return any(line.startswith("Error") for line in lines)
+
+class CheckpointIndex():
+    """
+    Sorted time -> checkpoint id map, so going back in time is a bisection instead of a checkpoint -list.
+    It is loaded from simv once, then kept up to date as runs create checkpoints (autocheckpoint takes one
+    right before every run, numbered one past the last). If a join ever fails the index is reloaded.
+    """
+
+    def __init__(self):
+        self.times = [] # sorted checkpoint times in ps
+        self.ids = [] # checkpoint id for each entry in times
+        self.last_id = 0
+        self.loaded = False
+
+    def load(self, checkpoints):
+        """Replace the index with the (id, time) tuples from parse_checkpoints"""
+
+        self.times = []
+        self.ids = []
+        self.last_id = 0
+        for checkpoint_id, checkpoint_time in checkpoints:
+            self.add(checkpoint_id, checkpoint_time)
+        self.loaded = True
+
+    def add(self, checkpoint_id, checkpoint_time):
+        """Record a checkpoint, replacing any older checkpoint at the same time"""
+
+        i = bisect.bisect_left(self.times, checkpoint_time)
+        if i < len(self.times) and self.times[i] == checkpoint_time:
+            self.ids[i] = checkpoint_id
+        else:
+            self.times.insert(i, checkpoint_time)
+            self.ids.insert(i, checkpoint_id)
+        try:
+            self.last_id = max(self.last_id, int(checkpoint_id))
+        except ValueError:
+            pass
+
+    def remove(self, checkpoint_id):
+        """Forget a checkpoint that was killed"""
+
+        if checkpoint_id in self.ids:
+            i = self.ids.index(checkpoint_id)
+            del self.ids[i]
+            del self.times[i]
+
+    def created(self, checkpoint_time):
+        """Note the checkpoint autocheckpoint takes right before a run starting at checkpoint_time"""
+
+        if self.loaded:
+            self.add(str(self.last_id + 1), checkpoint_time)
+
+    def closest(self, target_time):
+        """Find the latest checkpoint strictly before target_time, returning (id, time) or (None, 0)"""
+
+        i = bisect.bisect_left(self.times, target_time)
+        if i == 0:
+            return None, 0
+        return self.ids[i - 1], self.times[i - 1]
+
+    def invalidate(self):
+        """Forget the index so the next lookup reloads it from checkpoint -list"""
+
+        self.loaded = False
+
+class CheckpointPolicy():
+    """
+    Decides where checkpoints are taken and which ones are killed, keeping replays short and memory bounded.
+    A checkpoint is taken every interval clock cycles of forward running, and once more than budget exist the
+    ones whose removal opens the smallest gap relative to their distance from the current time are killed.
+    That keeps them dense around the current time and logarithmically sparser further back, so going back
+    any distance replays a bounded fraction of it. Without thinning the oldest are killed first instead.
+    """
+
+    def __init__(self, interval=DEFAULT_CHECKPOINT_INTERVAL, budget=DEFAULT_CHECKPOINT_BUDGET, thinning=True):
+        self.interval = max(0, int(interval))
+        # the first and the newest checkpoint are never killed
+        self.budget = max(3, int(budget))
+        self.thinning = thinning
+        self.spacing = 0 # ps between checkpoints, known once the clock speed is
+
+        self.hits = 0 # backward moves that started from a checkpoint
+        self.misses = 0 # backward moves that had to replay from the start
+        self.replayed = 0 # ps simulated again by backward moves
+        self.max_replay = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build the policy from the checkpoint_* keys of the settings file"""
+
+        return cls(
+            interval=settings.get("checkpoint_interval", DEFAULT_CHECKPOINT_INTERVAL),
+            budget=settings.get("checkpoint_budget", DEFAULT_CHECKPOINT_BUDGET),
+            thinning=settings.get("checkpoint_thinning", True),
+        )
+
+    @property
+    def managed(self):
+        """Whether checkpoints are taken by this policy rather than by VCS autocheckpoint"""
+
+        return self.interval > 0
+
+    def set_clock(self, clock_speed):
+        self.spacing = self.interval * clock_speed
+
+    def legs(self, index, start_time, duration, step=1):
+        """
+        Split a run of duration ps from start_time into (take a checkpoint first?, ps) legs,
+        so a checkpoint lands every spacing ps after the last one at or before start_time.
+        Legs are rounded up to whole multiples of step ps.
+        """
+
+        if not self.managed or self.spacing <= 0:
+            return [(False, duration)]
+
+        legs = []
+        time = start_time
+        end = start_time + duration
+        last_time = None # latest checkpoint at or before time, existing or planned here
+        while time < end:
+            # checkpoints left from earlier runs past start_time count too, so none are taken twice
+            existing_id, existing_time = index.closest(time + 1)
+            if existing_id is not None and (last_time is None or existing_time > last_time):
+                last_time = existing_time
+            take = last_time is None or time - last_time >= self.spacing
+            if take:
+                last_time = time
+            leg = min(end, last_time + self.spacing) - time
+            leg = min(end - time, -(-leg // step) * step)
+            legs.append((take, leg))
+            time += leg
+        return legs
+
+    def evictions(self, index, current_time):
+        """Pick the checkpoint ids to kill so that at most budget are left"""
+
+        if not index.loaded:
+            return []
+
+        times = list(index.times)
+        ids = list(index.ids)
+        evict = []
+        while len(times) > self.budget:
+            if self.thinning:
+                i = min(
+                    range(1, len(times) - 1),
+                    key=lambda i: (times[i + 1] - times[i - 1]) / max(abs(current_time - times[i]), self.spacing, 1),
+                )
+            else:
+                i = 1
+            evict.append(ids.pop(i))
+            times.pop(i)
+        return evict
+
+    def record(self, replay, hit):
+        """Count a backward move that replayed replay ps, from a checkpoint (hit) or from the start"""
+
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.replayed += replay
+        self.max_replay = max(self.max_replay, replay)
+
+    def stats(self, clock_speed):
+        """Hit/replay statistics, with replays in clock cycles"""
+
+        cycles = lambda ps: ps // clock_speed if clock_speed else ps
+        moves = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "replayed_cycles": cycles(self.replayed),
+            "average_replay_cycles": cycles(self.replayed // moves) if moves else 0,
+            "max_replay_cycles": cycles(self.max_replay),
+        }
+
+class ValueCache():
+    """
+    Values already read from simv, keyed by (simulation time in ps, signal), so revisiting a time
+    renders from memory. The code listing is stored the same way under its listing command.
+    Once more than size values are stored the least recently used ones are dropped.
+    """
+
+    def __init__(self, size=DEFAULT_VALUE_CACHE_SIZE):
+        self.size = max(0, int(size))
+        self.entries = OrderedDict()
+
+    def get(self, time, name):
+        """Return the value of name at time, or None if it isn't cached"""
+
+        key = (time, name)
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def lookup(self, time, names):
+        """Split names into a dict of the cached values at time and a list of the missing ones"""
+
+        found = {}
+        missing = []
+        for name in names:
+            value = self.get(time, name)
+            if value is None:
+                missing.append(name)
+            else:
+                found[name] = value
+        return found, missing
+
+    def update(self, time, values):
+        """Store a name -> value dict read at time"""
+
+        for name, value in values.items():
+            self.entries[(time, name)] = value
+            self.entries.move_to_end((time, name))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+def parse_hierarchy_dump(lines):
+    """
+    Parse the output of LIST_VARS_COMMAND into (name, type) tuples.
+    Returns None if the dump did not run to completion (e.g. hierarchy.tcl was never sourced)
+    or found nothing, which no real design gives, so the caller falls back to walking it from Python.
+    """
+
+    if not lines or lines[-1] != END_MARKER:
+        return None
+
+    entries = [line[len(VAR_MARKER):] for line in lines if line.startswith(VAR_MARKER)]
+    if not entries:
+        return None
+    return [(name, var_type) for name, var_type, is_instance in parse_show_type(entries) if not is_instance]
+
+def find_clock(lines):
+    """Pick the clock out of the top level `show` output"""
+
+    # TODO: should this use list_vars instead to recursively search for the clock?
+    # this is a bit of a hack, but it seems to work
+    for var in lines:
+        if "clock" in var or "clk" in var:
+            return var
+    # handle the case where no clock is found
+    raise ValueError("Could not find clock variable")
+
+class ResponseParser():
+    """
+    Incrementally split raw simv output into prompt-delimited responses.
+    Bytes are fed in arbitrarily sized chunks, and each line is only decoded once it is complete
+    (or once the prompt shows up on it).
+    """
+
+    def __init__(self, prompt=PROMPT):
+        self.prompt = prompt
+        self.buffer = bytearray()
+        self.lines = []
+        # number of bytes at the start of the buffer already searched for a newline/prompt
+        self.scanned = 0
+
+    def feed(self, data):
+        """Add a chunk of output, returning a list of every response (list of lines) completed by it"""
+
+        self.buffer += data
+        responses = []
+        pos = 0
+        # only the unterminated tail from the last feed has been scanned before
+        newline_start = self.scanned
+        prompt_start = max(0, self.scanned - len(self.prompt) + 1)
+
+        while True:
+            newline = self.buffer.find(b"\n", newline_start)
+            end = newline if newline != -1 else len(self.buffer)
+            prompt = self.buffer.find(self.prompt, prompt_start, end)
+
+            if prompt != -1:
+                # anything before the prompt on the same line is dropped, just like the prompt itself
+                responses.append(self.lines)
+                self.lines = []
+                pos = prompt + len(self.prompt)
+            elif newline != -1:
+                self.lines.append(self.buffer[pos:newline].decode(errors="replace"))
+                pos = newline + 1
+            else:
+                break
+
+            newline_start = pos
+            prompt_start = pos
+
+        del self.buffer[:pos]
+        self.scanned = len(self.buffer)
+        return responses
+
+class AsyncUCLI():
+    """
+    The simulator interface, driven by asyncio. The Textual app awaits these methods directly on its own
+    event loop, and UCLI runs it on a private one for blocking callers.
+    Commands from concurrent tasks are queued in order, but moving simv and reading values at the time
+    it was moved to are separate commands, so anything that moves simv or reads values tied to where it is
+    holds position_lock until it is done. Otherwise a read could land in the middle of another task's move
+    and its value would be cached under the wrong time.
+    """
+
+    def __init__(
+        self, cmd, verbose=False, pipeline=1, checkpoint_policy=None, value_cache_size=DEFAULT_VALUE_CACHE_SIZE, trace_path=None,
+        breakpoints=None, timeouts=None,
+    ):
         self.cmd = cmd
         self.verbose = verbose
-        self.proc = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        self.poll_obj = select.poll()
-        self.poll_obj.register(self.proc.stdout, select.POLLIN)
+        # the process is created in start, since that needs a running event loop
+        self.proc = None
+
+        self.clock_name = ""
+        self.clock_speed = 0 # ps
+
+        # scope -> show -type entries, the hierarchy doesn't change while simv runs
+        self.scopes = {}
+        self.checkpoints = CheckpointIndex()
+        self.checkpoint_policy = checkpoint_policy or CheckpointPolicy()
+        # installed as disabled stop points at boot, armed only while resuming
+        self.breakpoints = breakpoints if breakpoints is not None else BreakpointSet()
+        # values seen at each time, only filled while self.time is known
+        self.values = ValueCache(value_cache_size)
+        self.time = None # ps being looked at, known after set_time so refreshes and the next move don't have to ask simv
+        self.sim_time = None # ps simv is really at, which differs from self.time while browsing a recorded trace
+        self.trace = None # the last recorded window
+        # every watched value at every new time, appended to a trace on disk if trace_path is set,
+        # which is only created once start succeeds
+        self.trace_path = trace_path
+        self.trace_writer = None
 
         # when run is called add it to the queue of commands to be run
         # the loop automatically handles running commands in the order they were added,
-        # and will move the command string to the running command variable when popped from the command queue
+        # and will move the command to the in flight queue when it is written to simv
         # when the next values are read in, the command string will be the key to the output dictionary
         # this allows for easy access to the output of the command without worrying about "consuming" the output
         # and ensures that identical commands always give the latest output
+        # every queued command also gets a future that the loop resolves with its output as soon as the prompt
+        # comes back, so blocking callers can just wait on it instead of polling the output dictionary
+        # every command is prefixed with a sequence number that simv echoes back, so a response always goes to the
+        # request that sent it, even for identical commands, with pipeline > 1 commands in flight at once,
+        # or when an interrupt makes simv print a prompt nobody asked for
+
+        # max number of commands written to simv before their prompts come back
+        self.pipeline = max(1, pipeline)
+
+        self.commands = [] # (command, future) pairs
+        self.in_flight = deque() # (sequence number, command, future) written to simv, oldest first
+        self.seq = 0
+        self.futures = {} # command -> future of its latest unfinished run
+        self.started = {} # future of a command -> future resolved once simv starts on it, for _wait
+        self.output = {}
 
-        self.clock_name = ""
-        self.clock_speed = 0 # ps
+        self.waitingForPrompt = False
 
-        self.commands = []
-        self.running_command = None
-        self.output = {}
+        # seconds each command may take, see DEFAULT_COMMAND_TIMEOUTS
+        self.timeouts = dict(DEFAULT_COMMAND_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.interrupts = 0 # interrupts sent, so a run can tell it was cut short
+
+        # held from a move (or sync) until the reads that depend on where simv is are done, see the class docstring
+        self.position_lock = asyncio.Lock()
 
         self.EOF = False
-        self.waitingForPrompt = False
 
-        self.thread = None
+        self.reader = None
         self.stop = False
 
-    def start(self):
-        """Initialize the simulation and start the UCLI loop, blocking until ready"""
+    async def start(self):
+        """Launch and initialize the simulation and start the UCLI loop, returning once ready"""
 
-        # run the loop in a separate thread
-        self.thread = threading.Thread(target=self._loop, daemon=True)
-        self.thread.start()
+        self.proc = await asyncio.create_subprocess_exec(
+            *shlex.split(self.cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE
+        )
+        self.reader = asyncio.create_task(self._loop())
 
         # check that the command ran and didn't immediately exit
-        if self.proc.poll() is not None:
+        if self.proc.returncode is not None:
             raise FileNotFoundError(f"Executable {self.cmd.split()[0]} does not exist or exited immediately")
 
         # initialize the simulation
@@ -102,361 +698,695 @@ class UCLI():
         # we are (at least for now?) only allowing run as checkpoints
         self.run("config -precheckpoint -remove synopsys::step")
         self.run("config -precheckpoint -remove synopsys::next")
+        self.run(f"source {{{HIERARCHY_TCL}}}")
         self.run("run -delta")
 
         # now find the name of the clock
-        # TODO: should this use list_vars instead to recursively search for the clock?
-        # this is a bit of a hack, but it seems to work
-        variables = self.read("show", blocking=True, run=True)
-        for var in variables:
-            if "clock" in var or "clk" in var:
-                self.clock_name = var
-                break
-        # handle the case where no clock is found
-        if not self.clock_name:
-            raise ValueError("Could not find clock variable")
+        self.clock_name = find_clock(await self.read("show", blocking=True, run=True))
 
-        # TODO: would it be better to read the makefile and find the clock speed there?
         # now find the speed of the clock
-        self.read(f"run -change {self.clock_name}", blocking=True, run=True)
+        await self.read(f"run -change {self.clock_name}", blocking=True, run=True)
         try:
-            time_returned = self.read("senv time", blocking=True, run=True)[0]
+            time_returned = (await self.read("senv time", blocking=True, run=True))[0]
         except IndexError:
             raise ValueError("Could not find clock speed")
         # now parse out the " ps" and convert to an integer
         self.clock_speed = convert_time(time_returned) * 2 # the clock is half the speed of the time returned
-
-        # go back one checkpoint
-        self.run("checkpoint -join 2")
-
-        # block until all commands are finished, then clear output
-        while self.commands or self.running_command:
-            time.sleep(BUSY_WAIT_TIME)
+        self.checkpoint_policy.set_clock(self.clock_speed)
+
+        # go back one checkpoint, and wait until all commands are finished before clearing output
+        await self.run("checkpoint -join 2")
+
+        # from here on the policy takes the checkpoints, starting from the ones simv already has
+        if self.checkpoint_policy.managed:
+            self.run("config -autocheckpoint off")
+            self.checkpoints.load(parse_checkpoints(await self.run("checkpoint -list")))
+        # every saved breakpoint in one command
+        if len(self.breakpoints):
+            await self._install_breakpoints(list(self.breakpoints))
         self.output.clear()
 
+        if self.trace_path and not self.stop:
+            self.trace_writer = TraceWriter(self.trace_path)
+
     # -------------------- public methods --------------------
 
     def run(self, cmd):
-        """Run a custom command in the UCLI"""
+        """Run a custom command in the UCLI, returning a future that resolves to its output lines"""
+
+        future = self._new_future()
 
-        if self.proc.poll() is not None:
+        if self._exited():
             click.secho(f"Command '{cmd}' can not run, simulation has ended.", fg="red")
-            return
+            future.set_result([])
+            return future
 
-        self.commands.append(cmd)
+        self.commands.append((cmd, future))
+        self.futures[cmd] = future
 
-        # if there is no command currently running, just run it now
-        if self.waitingForPrompt:
+        # if there is no command currently running (or there is room in the pipeline), just run it now
+        if self.waitingForPrompt or self.in_flight:
             self._run()
 
-    def read(self, command, blocking=False, run=False):
+        return future
+
+    def interrupt(self):
+        """
+        Send simv SIGINT, which breaks a long run (or any command) back to the prompt. The command
+        gets whatever it printed so far, and since simv stopped somewhere unknown the time is forgotten.
+        Returns False if simv wasn't busy.
+        """
+
+        if not self.in_flight or self._exited():
+            return False
+        self.interrupts += 1
+        self.time = self.sim_time = None
+        try:
+            self.proc.send_signal(signal.SIGINT)
+        except ProcessLookupError:
+            return False
+        return True
+
+    async def read(self, command, blocking=False, run=False, timeout=None):
         """
         Read the output of a command,
-        optionally blocking until the output is available.
+        optionally waiting until the output is available. If it takes longer than timeout seconds
+        (the command's own timeout by default) simv is interrupted, see _watchdog.
         If the run flag is set, this function calls run first.
         """
 
         if run:
-            self.run(command)
+            future = self.run(command)
+        else:
+            future = self.futures.get(command)
 
-        if blocking:
-            while command not in self.output and self.proc.poll() is None:
-                time.sleep(BUSY_WAIT_TIME)
+        if blocking and future is not None:
+            return self._take_output(command, await self._wait(command, future, timeout))
 
-        # this will remove the command from the output dictionary
-        # do we want this behavior to allow blocking, or
-        # should we allow "caching" of the output for repeated access?
-        try:
-            return self.output.pop(command)
-        except KeyError:
-            return []
+        return self._pop_output(command)
 
-    def get_clock(self):
+    async def get_clock(self):
         """Special function to get the clock cycle and parse it instead of relying on get_var"""
 
-        total_time = self.get_time()
+        total_time = await self.get_time()
         if total_time == -1:
             return -1
-        cc = total_time // self.clock_speed
-        return cc
+        return total_time // self.clock_speed
 
-    def get_time(self):
+    async def get_time(self):
         """Special function to get the simulation time and parse it instead of relying on get_var"""
 
         try:
-            total_time = self.read("senv time", blocking=True, run=True)[0]
+            total_time = (await self.read("senv time", blocking=True, run=True))[0]
             return convert_time(total_time)
         except IndexError:
             return -1
 
-    def list_vars(self):
+    async def list_vars(self):
         """List all variables found in the Verilog code currently being simulated"""
 
-        variables = []
-        top_vars = self.read("show -type", blocking=True, run=True)
-        for var in top_vars:
-            var_name = var.split(" ")[0]
-            if len(var_name) >= 3 and var_name[0] == "{" and var_name[-1] == "}":
-                var_name = var_name[1:-1]
-            if var_name == "extra" or var_name == "":
-                continue
-            is_instance = var.split(" ")[1] == "{INSTANCE"
-            if is_instance:
-                sub_variables = self._recurse_list_vars(var_name)
-                variables.extend(sub_variables)
-            else:
-                variables.append((var_name, " ".join(var.split(" ")[1:])))
+        # one command that walks the hierarchy inside simv, falling back to walking it from here
+        variables = parse_hierarchy_dump(await self.read(LIST_VARS_COMMAND, blocking=True, run=True))
+        if variables is None:
+            variables = await self._recurse_list_vars(None)
         return variables
 
-    def _recurse_list_vars(self, var):
-        """Recursively list all variables found in the Verilog code currently being simulated"""
+    async def list_scope(self, scope=None):
+        """List the direct children of scope (or the top level) as (name, type, is_instance) tuples"""
 
-        # TODO: where is the "extra" variable coming from?
+        if scope not in self.scopes:
+            if scope is None:
+                cmd = "show -type"
+            else:
+                cmd = f"show -type {{{scope}.*}}"
+            self.scopes[scope] = parse_show_type(await self.read(cmd, blocking=True, run=True))
+        return self.scopes[scope]
+
+    async def _recurse_list_vars(self, var):
+        """Recursively list all variables below var (or the top level if var is None)"""
+
+        if var is None:
+            cmd = "show -type"
+        else:
+            # handle generate blocks
+            if len(var) >= 3 and var[0] == "{" and var[-1] == "}":
+                var = var[1:-1]
+            cmd = f"show -type {{{var}.*}}"
 
         variables = []
-        # get the children of the current variable
-
-        # handle generate blocks
-        if len(var) >= 3 and var[0] == "{" and var[-1] == "}":
-            var = var[1:-1]
-        
-        children = self.read(f"show -type {{{var}.*}}", blocking=True, run=True)
-        for child in children:
-            child_name = child.split(" ")[0]
-            if len(child_name) >= 3 and child_name[0] == "{" and child_name[-1] == "}":
-                child_name = child_name[1:-1]
-            if child_name == "extra" or child_name == "":
-                continue
-            is_instance = child.split(" ")[1] == "{INSTANCE"
+        children = await self.read(cmd, blocking=True, run=True)
+        for child_name, child_type, is_instance in parse_show_type(children):
             if is_instance:
-                sub_variables = self._recurse_list_vars(child_name)
-                variables.extend(sub_variables)
+                variables.extend(await self._recurse_list_vars(child_name))
             else:
-                variables.append((child_name, " ".join(child.split(" ")[1:])))
+                variables.append((child_name, child_type))
         return variables
 
-    def get_var(self, var):
+    async def get_var(self, var):
         """Get the value of a variable in the Verilog code currently being simulated"""
-        return self.read(f"get {{{var}}}", blocking=True, run=True)[0]
 
-    def get_vars(self, vars):
-        """Get the values of multiple variables in the Verilog code currently being simulated"""
+        async with self.position_lock:
+            return await self._get_var(var)
+
+    async def _get_var(self, var):
+        # get_var for callers already holding position_lock
+        simtime = self.time
+        if simtime is not None:
+            cached, _ = self._cached_snapshot(simtime, None, [var])
+            if var in cached:
+                return cached[var]
+            await self._sync()
+        reply = await self.read(f"get {{{var}}}", blocking=True, run=True)
+        if not reply:
+            # shut down (or gone) before answering, see _watchdog
+            return NO_REPLY
+        value = reply[0]
+        if simtime is not None:
+            self.values.update(simtime, {var: value})
+        return value
+
+    async def get_range(self, var, first, last, at=None):
+        """
+        Get elements first through last of a memory (in that order) with one ranged get, cached like get_var.
+        If at is given they are only read at that simulation time, None means the simulation has moved on since.
+        """
+
+        async with self.position_lock:
+            if at is not None:
+                current = self.time if self.time is not None else await self.get_time()
+                if current != at:
+                    return None
+            return await self._get_var(f"{var}[{first}:{last}]")
+
+    async def get_vars(self, vars):
+        """
+        Get the values of multiple variables in the Verilog code currently being simulated.
+        All of them are fetched with one batched command, falling back to one get per variable
+        for anything the batch could not return.
+        """
+
+        async with self.position_lock:
+            vars = list(vars)
+            if not vars:
+                return {}
+
+            reply = await self.read(batch_get_command(vars), blocking=True, run=True)
+            return await self._collect_vars(vars, reply)
+
+    async def get_snapshot(self, vars, code=LOCATION_COMMAND):
+        """
+        Get the simulation time (-1 if unavailable), the output of code (the active file and line,
+        unless a listing command is given) and the values of vars.
+        All three requests are queued before waiting so a pipelined UCLI sends them in one burst.
+        """
+
+        async with self.position_lock:
+            vars = list(vars)
+            listing = code
+            # at a known time only what isn't cached yet is asked for
+            simtime = self.time
+            cached, missing = self._cached_snapshot(simtime, listing, vars)
+            if missing and simtime is not None:
+                # anything not recorded or cached comes from simv, at the time being looked at
+                await self._sync()
+            time_future = self.run("senv time") if simtime is None else None
+            code_future = self.run(listing) if listing in missing else None
+            missing_vars = [var for var in missing if var != listing]
+            vars_command = batch_get_command(missing_vars)
+            vars_future = self.run(vars_command) if missing_vars else None
+
+            if time_future:
+                try:
+                    simtime = convert_time((await self._wait("senv time", time_future))[0])
+                except IndexError:
+                    simtime = -1
+            # waited on in the order they were sent, so a stuck command's watchdog runs before anything waits forever behind it
+            code_lines = await self._wait(listing, code_future) if code_future else None
+            fetched = await self._collect_vars(missing_vars, await self._wait(vars_command, vars_future)) if vars_future else {}
+            if code_future:
+                fetched[listing] = code_lines
+            return self._finish_snapshot(simtime, listing, vars, cached, fetched)
+
+    async def _collect_vars(self, vars, reply):
+        batched, _ = parse_batch_reply(reply)
+
         variables = {}
         for var in vars:
-            variables[var] = self.get_var(var)
+            if var in batched:
+                variables[var] = batched[var]
+            elif self.stop:
+                # nothing more will be answered, so don't queue a get for every signal left
+                variables[var] = NO_REPLY
+            else:
+                variables[var] = await self._get_var(var)
         return variables
 
-    # Ok don't do it this way it's way too slow to read in big variables like memory
-    # def get_vars(self):
-    #     """Get the values of all variables in the Verilog code currently being simulated"""
-
-    #     var_dict = {}
-    #     top_vars = self.read("show -type", blocking=True, run=True)
-    #     values = self.read("show -value", blocking=True, run=True)
-    #     for value in values:
-    #         var_name = value.split(" ")[0]
-    #         var_value = " ".join(value.split(" ")[1:])
-    #         var_dict[var_name] = var_value
-    #     for var in top_vars:
-    #         var_name = var.split(" ")[0]
-    #         is_instance = var.split(" ")[1] == "{INSTANCE"
-    #         if is_instance:
-    #             sub_values = self._recurse_get_vars(var_name)
-    #             # combine the dictionaries
-    #             for key in sub_values:
-    #                 var_dict[key] = sub_values[key]
-    #     return var_dict
-
-    # def _recurse_get_vars(self, var):
-    #     """Recursively get the values of all variables in the Verilog code currently being simulated"""
-
-    #     values = {}
-    #     # get the children of the current variable
-    #     children = self.read(f"show -type {var}.*", blocking=True, run=True)
-    #     child_values = self.read(f"show -value {var}.*", blocking=True, run=True)
-    #     for child_value in child_values:
-    #         child_name = child_value.split(" ")[0]
-    #         child_value = " ".join(child_value.split(" ")[1:])
-    #         values[child_name] = child_value
-    #     for child in children:
-    #         child_name = child.split(" ")[0]
-    #         is_instance = child.split(" ")[1] == "{INSTANCE"
-    #         if is_instance:
-    #             sub_values = self._recurse_get_vars(child_name)
-    #             # combine the dictionaries
-    #             for key in sub_values:
-    #                 values[key] = sub_values[key]
-    #     return values
-
-    def set_time(self, target_time, relative=False):
+    async def set_time(self, target_time, relative=False):
         """Set the simulation time to a specific (relative?) value in ps"""
 
-        # can't go to negative absolute time
-        if not relative and target_time < 0:
-            return False, ""
+        async with self.position_lock:
+            # can't go to negative absolute time
+            if not relative and target_time < 0:
+                return False, ""
 
-        # if relative time and target time is 0, do nothing
-        if relative and target_time == 0:
-            return True, ""
+            # if relative time and target time is 0, do nothing
+            if relative and target_time == 0:
+                return True, ""
 
-        current_time = self.get_time()
+            # relative times count from the time being looked at, which may be inside a recorded trace
+            if relative:
+                if self.time is None:
+                    self.sim_time = await self.get_time()
+                    target_time += self.sim_time
+                else:
+                    target_time += self.time
+                if target_time < 0:
+                    return False, ""
 
-        # if negative relative time, convert to absolute time
-        if relative and target_time < 0:
-            target_time = current_time + target_time
-            relative = False
+            # inside the recorded window nothing has to run, the trace already has the watched values
+            if self.trace is not None and self.trace.covers(target_time):
+                self.time = target_time
+                return True, ""
 
-        # if absolute time and target time is > current time, convert to relative time
-        if not relative and target_time > current_time:
-            target_time = target_time - current_time
-            relative = True
+            return True, await self._move(target_time)
 
-        # this should handle all future times (relative or absolute, but always converted to relative before here)
-        # if relative time, just run to there
-        if relative:
-            output = self.read(f"run -relative {convert_time_to_str(target_time)}", blocking=True, run=True)
-            return True, output
+    async def _move(self, target_time):
+        # move simv itself to the absolute target_time, from wherever it really is
+        current_time = self.sim_time if self.sim_time is not None else await self.get_time()
+        # simv may be anywhere until the run that ends at the target finishes
+        self.time = self.sim_time = None
 
-        # here we have absolute time and target time < current time
+        # future times are just a run away
+        if target_time > current_time:
+            return await self._run_relative(current_time, target_time - current_time)
 
-        # now, calculate the difference
-        time_diff = target_time - current_time
+        if target_time == current_time:
+            self.time = self.sim_time = current_time
+            return ""
 
-        # if time is 0, do nothing
-        if time_diff == 0:
-            return True, ""
+        # find the closest checkpoint (but still less than the target time) from the index
+        if not self.checkpoints.loaded:
+            self.checkpoints.load(parse_checkpoints(await self.read("checkpoint -list", blocking=True, run=True)))
+        closest_id, closest_time = self.checkpoints.closest(target_time)
 
-        if time_diff > 0:
-            output = self.read(f"run -relative {convert_time_to_str(time_diff)}", blocking=True, run=True)
-            return True, output
+        # if a checkpoint is found, go to that checkpoint and then run to the target time
+        if closest_id:
+            joined = await self.read(f"checkpoint -join {closest_id}", blocking=True, run=True)
+            if not command_failed(joined):
+                self.checkpoint_policy.record(target_time - closest_time, hit=True)
+                return await self._run_relative(closest_time, target_time - closest_time)
+            # the index was out of date, so start over from a fresh checkpoint -list next time
+            self.checkpoints.invalidate()
 
-        # get checkpoints and see which has the closest time (but is still less than the target time)
-        checkpoints = self.read("checkpoint -list", blocking=True, run=True)
-        closest_checkpoint = None
-        closest_time = 0
+        # if no checkpoints are found, go to start and then run to the target time
+        await self.read("checkpoint -join 1", blocking=True, run=True)
+        self.checkpoint_policy.record(target_time, hit=False)
+        return await self._run_relative(0, target_time)
+
+    async def _sync(self):
+        # bring simv to the time being looked at, if browsing a trace left it somewhere else
+        if self.time is not None and self.time != self.sim_time:
+            await self._move(self.time)
+
+    async def _run_relative(self, current_time, time_diff):
+        # an interrupted run stops short of the target, somewhere only simv knows (see interrupt)
+        interrupts = self.interrupts
+        if not self.checkpoint_policy.managed:
+            self.checkpoints.created(current_time)
+            output = await self.read(f"run -relative {convert_time_to_str(time_diff)}", blocking=True, run=True)
+            if self.interrupts == interrupts:
+                self.time = self.sim_time = current_time + time_diff
+            return output
+
+        output = []
+        for checkpoint, leg in self.checkpoint_policy.legs(self.checkpoints, current_time, time_diff):
+            if checkpoint:
+                await self.read("checkpoint -add", blocking=True, run=True)
+                self.checkpoints.created(current_time)
+            output += await self.read(f"run -relative {convert_time_to_str(leg)}", blocking=True, run=True)
+            if self.interrupts != interrupts:
+                return output
+            current_time += leg
+        self.time = self.sim_time = current_time
+
+        await self._evict_checkpoints(current_time)
+        return output
+
+    async def _install_breakpoints(self, breakpoints):
+        # one command for all of them, whatever simv refused is left without a stop point and returned
+        return parse_install_reply(await self.read(install_breakpoints_command(breakpoints), blocking=True, run=True), breakpoints)
+
+    async def _prepare_run(self):
+        # bring simv to the time being looked at before a run that stops wherever simv decides
+        await self._sync()
+        start_time = self.sim_time if self.sim_time is not None else await self.get_time()
+        # a checkpoint where the run starts, so coming back from wherever it stops doesn't replay from further away
+        if not self.checkpoint_policy.managed:
+            self.checkpoints.created(start_time)
+        elif self.checkpoint_policy.legs(self.checkpoints, start_time, 1)[0][0]:
+            await self.read("checkpoint -add", blocking=True, run=True)
+            self.checkpoints.created(start_time)
+
+    async def _run_free(self, max_cycles=None):
+        # one run until simv stops by itself (a stop point or the end) or max_cycles clock cycles have passed,
+        # returning (output, whether the simulation finished)
+        # a stop can land part way through a time, so values read afterwards must not be cached
+        self.time = self.sim_time = None
+        limit = max_cycles * self.clock_speed if max_cycles else None
+        run = f"run -relative {convert_time_to_str(limit)}" if limit else "run"
+        output = await self.read(run, blocking=True, run=True)
+
+        end_time = await self.get_time()
+        if self.checkpoint_policy.managed and end_time != -1:
+            await self._evict_checkpoints(end_time)
+        return output, end_time == -1 or any(FINISH_RE.search(line) for line in output)
+
+    async def _evict_checkpoints(self, current_time):
+        for checkpoint_id in self.checkpoint_policy.evictions(self.checkpoints, current_time):
+            await self.read(f"checkpoint -kill {checkpoint_id}", blocking=True, run=True)
+            self.checkpoints.remove(checkpoint_id)
+
+    async def record(self, vars, cycles, code=LOCATION_COMMAND, listings=()):
+        """
+        Run the simulation cycles clock cycles ahead in one go, capturing the output of code, of any other code
+        listing commands in listings (see listing_command) and vars at every cycle into self.trace,
+        and return the output of the runs. The view stays where it was, at the start of the trace.
+        """
 
-        # if there are checkpoints, remove first line
-        if len(checkpoints) > 0:
-            checkpoints.pop(0)
+        async with self.position_lock:
+            vars = list(vars)
+            listings = [code] + [listing for listing in listings if listing != code]
+            await self._sync()
+            start_time = self.sim_time if self.sim_time is not None else await self.get_time()
+            self.time = self.sim_time = None
+
+            trace = Trace(vars)
+            output = []
+            interrupts = self.interrupts
+            current_time = start_time
+            legs = self.checkpoint_policy.legs(self.checkpoints, start_time, cycles * self.clock_speed, step=self.clock_speed)
+            for checkpoint, leg in legs:
+                if checkpoint:
+                    await self.read("checkpoint -add", blocking=True, run=True)
+                    self.checkpoints.created(current_time)
+                cmd = record_command(vars, leg // self.clock_speed, self.clock_speed, listings, capture_first=len(trace) == 0)
+                captured, run_output = parse_record_reply(await self.read(cmd, blocking=True, run=True), listings)
+                for cycle, values in captured:
+                    trace.append(current_time + cycle * self.clock_speed, values)
+                self._write_trace([
+                    (current_time + cycle * self.clock_speed, {var: values[var] for var in vars if var in values})
+                    for cycle, values in captured
+                ])
+                output += run_output
+                if self.interrupts != interrupts:
+                    # whatever was captured before the interrupt is kept, but where simv stopped isn't known
+                    current_time = None
+                    break
+                current_time += leg
 
-        for checkpoint in checkpoints:
-            checkpoint_time = checkpoint.split("Time : ")[1].split(" Descr : ")[0]
-            checkpoint_time = convert_time(checkpoint_time)
-            if checkpoint_time < target_time and checkpoint_time > closest_time:
-                closest_time = checkpoint_time
-                closest_checkpoint = checkpoint.split(":")[0].strip()
+            if self.checkpoint_policy.managed and current_time is not None:
+                await self._evict_checkpoints(current_time)
+            else:
+                # autocheckpoint took one before every run of the loop
+                self.checkpoints.invalidate()
 
-        # if no checkpoints are found, go to start and then run to the target time
-        if not closest_checkpoint:
-            self.read("checkpoint -join 1", blocking=True, run=True)
-            output = self.read(f"run -relative {convert_time_to_str(target_time)}", blocking=True, run=True)
-            return True, output
+            self.trace = trace
+            self.sim_time = current_time
+            self.time = start_time
+            return output
 
-        # if a checkpoint is found, go to that checkpoint and then run to the target time
-        self.read(f"checkpoint -join {closest_checkpoint}", blocking=True, run=True)
-        if closest_time < target_time:
-            output = self.read(f"run -relative {convert_time_to_str(target_time - closest_time)}", blocking=True, run=True)
-            return True, output
+    def checkpoint_stats(self):
+        """Hit/replay statistics of backward moves, see CheckpointPolicy.stats"""
 
-        return True, "UCLI.py: How did we get here?"
+        return self.checkpoint_policy.stats(self.clock_speed)
 
-    def clock_cycle(self, cycles):
+    async def clock_cycle(self, cycles):
         """Run the simulation for a number of clock cycles"""
 
-        # behind the scenes, should actually convert to time and call set_time
-        target_time = (cycles * self.clock_speed) # + self.get_time() # don't need with relative=True
-
-        success, output = self.set_time(target_time, relative=True)
+        return await self.set_time(cycles * self.clock_speed, relative=True)
 
-        return success, output
-
-    def step_next(self, numLines=10):
+    async def step_next(self, numLines=10):
         """Run the simulation to the next step"""
 
-        return self.read("step", blocking=True, run=True)
-
+        async with self.position_lock:
+            await self._sync()
+            # a step can stop part way through a time, so values read afterwards must not be cached
+            self.time = self.sim_time = None
+            return await self.read("step", blocking=True, run=True)
 
-    def get_code(self, numLines=10):
+    async def get_code(self, numLines=10):
         """Get the current code listing from the simulation"""
 
-        code = self.read(f"listing -active {numLines}", blocking=True, run=True)
+        async with self.position_lock:
+            listing = listing_command(numLines)
+            if self.time is not None:
+                cached, _ = self._cached_snapshot(self.time, listing, [])
+                if listing in cached:
+                    return cached[listing]
+                await self._sync()
+            return await self.read(listing, blocking=True, run=True)
 
-        return code
-
-    # TODO: add a way to run the simulation for a certain amount of time
-
-    # TODO: add a way to run the simulation until a certain variable changes
+    async def run_until(self, kind, target, value=None, max_cycles=None):
+        """
+        Run until a condition holds (see stop_command), for at most max_cycles clock cycles if given.
+        The condition is a stop point inside simv, so the whole run is one command at full simulator speed.
+        Returns (hit, finished, output): hit if the stop point fired, finished if the simulation ended instead.
+        """
 
-    # TODO: stop the simulation
+        async with self.position_lock:
+            await self._prepare_run()
+            stop_id = parse_stop_id(await self.read(stop_command(kind, target, value), blocking=True, run=True))
+            if stop_id is None:
+                return False, False, [f"Could not set a stop condition on {target}"]
+            output, finished = await self._run_free(max_cycles)
+            await self.read(f"stop -delete {stop_id}", blocking=True, run=True)
+            return stop_hit(output, stop_id), finished, output
 
-    # TODO: reset the simulation
+    async def add_breakpoint(self, breakpoint):
+        """Add a breakpoints.Breakpoint and install its stop point, returning it (or the same one if it was already set)"""
 
-    # TODO: handle crashes / infinite loops
+        breakpoint = self.breakpoints.add(breakpoint)
+        if breakpoint.stop_id is None:
+            await self._install_breakpoints([breakpoint])
+        return breakpoint
 
-    # TODO: run gdb commands with cbug::gdb gdb-cmd
+    async def remove_breakpoint(self, key):
+        """Remove a breakpoint and its stop point, returning it (or None if there was none with that key)"""
 
-    # TODO: add breakpoints
+        breakpoint = self.breakpoints.remove(key)
+        if breakpoint is not None and breakpoint.stop_id is not None:
+            await self.read(f"stop -delete {breakpoint.stop_id}", blocking=True, run=True)
+        return breakpoint
 
-    # TODO: add support for changing variables
+    async def resume(self, max_cycles=None):
+        """
+        Run until an enabled breakpoint fires, for at most max_cycles clock cycles if given, in one run.
+        Returns (the breakpoints hit, whether the simulation finished, output).
+        """
 
-    # TODO: add ucli command line input
+        async with self.position_lock:
+            await self._prepare_run()
+            armed = self.breakpoints.armed()
+            if armed:
+                await self.read(stop_points_command("enable", armed), blocking=True, run=True)
+            output, finished = await self._run_free(max_cycles)
+            if armed:
+                await self.read(stop_points_command("disable", armed), blocking=True, run=True)
+            return self.breakpoints.record_hits(output), finished, output
 
     # -------------------- private methods --------------------
 
+    def _new_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def _timeout_for(self, command):
+        return self.timeouts.get(command.split(" ", 1)[0], self.timeouts.get("default"))
+
+    def _cached_snapshot(self, simtime, listing, vars):
+        # split a snapshot into what the value cache or the recorded trace already has at simtime and what must be read
+        names = [listing] + vars if listing else list(vars)
+        if simtime is None:
+            return {}, names
+        found, missing = self.values.lookup(simtime, names)
+        if missing and self.trace is not None:
+            traced, missing = self.trace.lookup(simtime, missing)
+            found.update(traced)
+        return found, missing
+
+    def _finish_snapshot(self, simtime, listing, vars, cached, fetched):
+        # remember what was read if the time is known, then put the (time, code, values) snapshot together
+        known = self.time is not None and simtime == self.time
+        if known:
+            self.values.update(simtime, fetched)
+        cached.update(fetched)
+        values = {var: cached[var] for var in vars}
+        if known:
+            self._write_trace([(simtime, values)])
+        return simtime, cached[listing], values
+
+    def _write_trace(self, rows):
+        # append (time, values) rows to the on-disk trace, which skips any time it already has
+        if self.trace_writer is not None:
+            for simtime, values in rows:
+                self.trace_writer.append(simtime, values)
+            self.trace_writer.flush()
+
+    def _close_trace(self):
+        # close may run from __del__ on a half constructed client
+        if getattr(self, "trace_writer", None) is not None:
+            self.trace_writer.close()
+            self.trace_writer = None
+
+    def _take_output(self, command, lines):
+        # the future always has this request's own output, even if an identical command finished since
+        if self.output.get(command) is lines:
+            del self.output[command]
+        return lines
+
+    def _pop_output(self, command):
+        # this will remove the command from the output dictionary
+        # do we want this behavior to allow blocking, or
+        # should we allow "caching" of the output for repeated access?
+        try:
+            return self.output.pop(command)
+        except KeyError:
+            return []
+
     def _run(self):
-        if self.commands:
-            cmd = self.commands.pop(0)
-            self.running_command = cmd
+        sent = False
+        while self.commands and len(self.in_flight) < self.pipeline:
+            # don't let anything else sit in simv's stdin while the simulation moves
+            if self.in_flight and (self._is_barrier(self.in_flight[-1][1]) or self._is_barrier(self.commands[0][0])):
+                break
+
+            cmd, future = self.commands.pop(0)
+            self.seq += 1
+            self.in_flight.append((self.seq, cmd, future))
 
-            self.proc.stdin.write((cmd + "\n").encode())
-            self.proc.stdin.flush()
+            line = f"puts {{{SEQ_MARKER}{self.seq}}}; {cmd}"
+            self.proc.stdin.write((line + "\n").encode())
+            sent = True
+
+        if sent:
             self.waitingForPrompt = False
-            return True
+        self._notify_started()
         # if no incoming commands, do nothing and just wait for the prompt
-        return False
+        return sent
+
+    def _notify_started(self):
+        # simv works on the oldest command in flight, so that is the one whose timeout starts now
+        if self.in_flight:
+            started = self.started.pop(self.in_flight[0][2], None)
+            if started is not None and not started.done():
+                started.set_result(None)
+
+    def _is_barrier(self, cmd):
+        return cmd.split(" ", 1)[0] in PIPELINE_BARRIERS
+
+    def _complete(self, command_output):
+        """Hand a finished response to whoever is waiting on it, then send the next command"""
+
+        entry = None
+        if self.in_flight:
+            if command_output and command_output[0].startswith(SEQ_MARKER):
+                seq = int(command_output[0][len(SEQ_MARKER):])
+                command_output = command_output[1:]
+                # anything older than this response will never get one
+                while self.in_flight and self.in_flight[0][0] < seq:
+                    self._resolve(self.in_flight.popleft()[2], [])
+                if self.in_flight and self.in_flight[0][0] == seq:
+                    entry = self.in_flight.popleft()
+
+        # grab the command string and use it as the key for the output dictionary
+        if entry:
+            _, cmd, future = entry
+            self.output[cmd] = command_output
+            if self.futures.get(cmd) is future:
+                del self.futures[cmd]
+            self._resolve(future, command_output)
+        else:
+            self.output["undefined"] = command_output
+
+        self._run()
+        if not self.in_flight:
+            self.waitingForPrompt = True
+
+    def _cancel_pending(self):
+        """Wake up everyone still waiting on a command that will now never finish"""
+
+        pending = [future for _, future in self.commands]
+        pending.extend(future for _, _, future in self.in_flight)
+        self.commands = []
+        self.in_flight.clear()
+        self.futures.clear()
+
+        for future in pending:
+            self._resolve(future, [])
+
+    def _resolve(self, future, lines):
+        # a caller that gave up (timeout or cancelled task) may have already cancelled its future
+        if not future.done():
+            future.set_result(lines)
+
+    async def _wait(self, command, future, timeout=None):
+        # the output of command once future resolves, interrupting simv if that takes longer than timeout
+        # seconds (the command's own timeout by default), see _watchdog
+        if timeout is None:
+            timeout = self._timeout_for(command)
+        if timeout is not None:
+            # the clock only starts once simv is working on command, not while it waits behind someone else's run
+            await self._started(future)
+        try:
+            # shield so a timeout or a cancelled worker doesn't cancel the command itself
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return await self._watchdog(command, future)
+
+    async def _started(self, future):
+        # returns once the command of future is the oldest in flight (see _notify_started) or has finished
+        if future.done() or (self.in_flight and self.in_flight[0][2] is future):
+            return
+        started = self.started[future] = self._new_future()
+        try:
+            await asyncio.wait([started, future], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.started.pop(future, None)
+
+    async def _watchdog(self, command, future):
+        # command ran past its timeout: interrupt simv, and if even that doesn't bring the prompt back
+        # (a $finish that never returns, say) nothing else would ever finish either, so shut it down
+        if self.verbose:
+            click.secho(f"Command '{command}' timed out, interrupting the simulation.", fg="red")
+        if self.interrupt():
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), INTERRUPT_GRACE)
+            except asyncio.TimeoutError:
+                pass
+        self.close()
+        return []
 
-    def _loop(self):
-        command_output = []
-        line = ""
+    def _exited(self):
+        return self.proc is None or self.proc.returncode is not None
+
+    async def _loop(self):
+        parser = ResponseParser()
 
         # while proc is running
-        while not self.EOF and not self.stop and self.proc.poll() is None:
-            c = self.proc.stdout.read(1)
-            if c == b"":
+        while not self.EOF and not self.stop:
+            chunk = await self.proc.stdout.read(READ_CHUNK_SIZE)
+            if chunk == b"":
                 self.EOF = True
                 break
-            elif c == b"\n":
-                command_output.append(line)
-                line = ""
-            else:
-                line += c.decode()
-
-            if "ucli% " in line:
-                # grab the command string and use it as the key for the output dictionary
-                if self.running_command:
-                    self.output[self.running_command] = command_output
-                    self.running_command = None
-                else:
-                    self.output["undefined"] = command_output
-
-                command_output = []
-                line = ""
 
+            for command_output in parser.feed(chunk):
                 if self.stop:
-                    self.run("exit")
                     break
-                else:
-                    ran_cmd = self._run()
-                    if not ran_cmd:
-                        self.waitingForPrompt = True
-
-        # TODO: handle the case where the process has ended
-        # ie, should we restart the process? or just let it die?
+                self._complete(command_output)
 
         if self.verbose:
             if self.commands:
                 click.secho("Commands left in queue:", fg="black")
-                for cmd in self.commands:
+                for cmd, _ in self.commands:
                     click.secho(cmd, fg="black")
 
         # gracefully close the process and cleanup
@@ -464,24 +1394,88 @@ class UCLI():
 
     def close(self):
         self.stop = True
-        if "proc" in dir(self):
+        self._close_trace()
+        self._cancel_pending()
+        if self.proc is not None:
             # run exit command to close the simulation
             try:
                 self.proc.stdin.write("exit\n".encode())
-                self.proc.stdin.flush()
                 self.proc.stdin.close()
-                self.proc.stdout.close()
-                self.proc.stderr.close()
                 self.proc.kill()
-                # self.proc.wait()
-            except (BrokenPipeError, ValueError):
+            except (BrokenPipeError, ProcessLookupError, RuntimeError):
                 pass
 
-        # self.thread.join()
+        if self.reader is not None and self.reader is not asyncio.current_task():
+            self.reader.cancel()
+
+class UCLI():
+    """
+    Blocking front end to AsyncUCLI for scripts and benchmarks. The client runs on a private event loop
+    in a daemon thread, each coroutine method blocks until it finishes there, and run returns
+    a concurrent.futures.Future. Everything else (clock_speed, time, stop, ...) is read from the client.
+    """
+
+    def __init__(self, cmd, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = AsyncUCLI(cmd, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for what the wrapper itself doesn't have
+        if name in ("client", "loop", "thread"):
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if inspect.iscoroutinefunction(attr):
+            return lambda *args, **kwargs: self._call(attr(*args, **kwargs))
+        return attr
+
+    def run(self, cmd):
+        """Run a custom command in the UCLI, returning a future that resolves to its output lines"""
+
+        return self._submit(self._run(cmd))
+
+    def interrupt(self):
+        """Interrupt whatever simv is running, see AsyncUCLI.interrupt"""
+
+        return self._call(self._interrupt())
+
+    def close(self):
+        # may run from __del__ on a half constructed wrapper, or a second time
+        loop = getattr(self, "loop", None)
+        if loop is None or loop.is_closed():
+            return
+        if self.thread.is_alive():
+            self._call(self._shutdown())
+            loop.call_soon_threadsafe(loop.stop)
+            self.thread.join()
+        loop.close()
 
     def __del__(self):
         self.close()
 
+    # -------------------- private methods --------------------
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _call(self, coroutine):
+        return self._submit(coroutine).result()
+
+    async def _run(self, cmd):
+        return await self.client.run(cmd)
+
+    async def _interrupt(self):
+        return self.client.interrupt()
+
+    async def _shutdown(self):
+        # closing only kills simv, waiting for it here lets the loop clean up its pipes before it stops
+        self.client.close()
+        if self.client.proc is not None:
+            await self.client.proc.wait()
+        if self.client.reader is not None:
+            await asyncio.gather(self.client.reader, return_exceptions=True)
+
 if __name__ == "__main__":
     import sys
 
@@ -6,7 +6,7 @@ from textual.containers import (
     Container,
     VerticalScroll,
 )
-from textual.widgets import Button, Footer, Header, Static, Label, Input, Pretty, Checkbox, RichLog, Tabs, Tab, TabbedContent, TabPane, Select, Collapsible
+from textual.widgets import Button, Footer, Header, Static, Label, Input, Pretty, Checkbox, RichLog, Tabs, Tab, TabbedContent, TabPane, Select, Collapsible, Tree, DataTable
 from textual.reactive import reactive
 from textual import events
 from textual.suggester import SuggestFromList
@@ -16,6 +16,7 @@ from textual.widget import Widget
 from textual.binding import Binding
 
 from rich.syntax import Syntax
+from rich.text import Text
 
 import os
 import json
@@ -23,6 +24,8 @@ import click
 import time
 
 from settings import Globals
+from memview import MemoryView, memory_range, is_memory
+from search import SignalIndex, SEARCH_DEBOUNCE
 
 import sentry_sdk
 
@@ -37,9 +40,11 @@ sentry_sdk.init(
     profiles_sample_rate=1.0,
 )
 
+VALUE_CELL_WIDTH = 80 # characters of a value shown in the watch table
+
 
 class VariableDisplay(Widget):
-    """A static widget that displays the value of a variable."""
+    """A static widget that displays the value of a variable, with its drivers and loads."""
 
     class Selected(Message):
         def __init__(self, id):
@@ -55,6 +60,8 @@ class VariableDisplay(Widget):
     def __init__(self, variable: str, id=None, var_type="") -> None:
         self.var_name = variable
         self.var_type = var_type
+        # big arrays are paged in by a MemoryView instead of being read whole on every refresh
+        self.is_memory = is_memory(var_type)
         super().__init__(id=id)
 
     def on_mount(self) -> None:
@@ -64,8 +71,11 @@ class VariableDisplay(Widget):
     def compose(self) -> ComposeResult:
         with Horizontal(classes="variable_content"):
             yield Static(self.var_name, classes="variable_name")
-            # TODO: change to text box to allow changing?
-            yield Label(f"{self.var_val}", classes="variable_value")
+            if self.is_memory:
+                yield MemoryView(self.var_name, memory_range(self.var_type), classes="memory_view")
+            else:
+                # TODO: change to text box to allow changing?
+                yield Label(f"{self.var_val}", classes="variable_value")
             yield Checkbox(
                 "",
                 id=f"{self.var_name.replace('.', '-dot-').replace('[', '-lbr-').replace(']', '-rbr-').replace('$', '-ds-')}-button",
@@ -82,15 +92,15 @@ class VariableDisplay(Widget):
 
             # TODO: sparkline of values over time here
 
-    def on_collapsible_expanded(self, event):
+    async def on_collapsible_expanded(self, event):
         if Globals().ucli is not None:
-            drivers = Globals().ucli.read(f"drivers {{{self.var_name}}} -full", blocking=True, run=True)
+            drivers = await Globals().ucli.read(f"drivers {{{self.var_name}}} -full", blocking=True, run=True)
             if drivers == "":
                 drivers = "None"
             # if read is a list, convert to a string
             if isinstance(drivers, list):
                 drivers = "\n".join(drivers)
-            loads = Globals().ucli.read(
+            loads = await Globals().ucli.read(
                 f"loads {{{self.var_name}}} -full", blocking=True, run=True
             )
             if loads == "":
@@ -114,12 +124,20 @@ class VariableDisplay(Widget):
 
 
 class VariableDisplayList(Widget):
-    """A static widget that displays the value of all watched variables."""
-
-    all_variables = reactive({}, recompose=True)
-    watched_variables = reactive(list, recompose=True)
-    unused_variables = reactive(list, recompose=True)
-    dropdown_options = reactive(list, recompose=True)
+    """
+    The watch list: one table row per watched variable, updated in place, and a VariableDisplay
+    with the details of whichever row is selected. The table only draws the rows on screen,
+    so thousands of watches cost no more to show than a few.
+    """
+
+    BINDINGS = [
+        Binding("b", "break_on_change", "Break when it changes", show=False),
+    ]
+
+    class Break(Message):
+        def __init__(self, var):
+            self.var = var
+            super().__init__()
 
     def update_variable_list(self):
         # turn Globals().variables list of tuples into a dictionary
@@ -137,85 +155,152 @@ class VariableDisplayList(Widget):
             else:
                 self.watched_variables = []
 
-            self.unused_variables = [
-                var for var in self.all_variables if var not in self.watched_variables
-            ]
+            self.index = SignalIndex(self.all_variables)
 
             if self.is_mounted:
-                self.dropdown_options = [(var, var) for var in self.unused_variables]
-                self.query_one("#add_var").set_options(self.dropdown_options)
-                self.mutate_reactive(VariableDisplayList.dropdown_options)
-                self.query_one("#add_var").set_options(self.dropdown_options)
+                self._sync_rows()
+                self._update_dropdown()
 
     def __init__(self, *children, name = None, id = None, classes = None, disabled = False):
         super().__init__(*children, name=name, id=id, classes=classes, disabled=disabled)
 
-        self.update_variable_list()
+        self.all_variables = {}
+        self.watched_variables = []
+        self.index = SignalIndex([])
+        self.dropdown_options = []
+        self.search_timer = None
+        # watch -> the full rendered value last shown for it
+        self.values = {}
+        # (simulation time, exact) of the last values, for memory views opened later
+        self.time = None
+        self.selected = None # the watch shown in the VariableDisplay
 
-        # self.query_one("#add_var").set_options((var, var) for var in self.unused_variables)
+        self.update_variable_list()
 
     def on_mount(self) -> None:
-        self.update_variable_list()
+        table = self.query_one("#watch_table", DataTable)
+        table.add_column("Name", key="name")
+        table.add_column("Type", key="type")
+        table.add_column("Value", key="value")
 
-        self.dropdown_options = [(var, var) for var in self.unused_variables]
-        self.query_one("#add_var").set_options(self.dropdown_options)
-        self.mutate_reactive(VariableDisplayList.dropdown_options)
-        self.query_one("#add_var").set_options(self.dropdown_options)
+        self.update_variable_list()
+        self._sync_rows()
+        self._update_dropdown()
 
     def compose(self) -> ComposeResult:
         """Create the text to display in the widget."""
 
-        if len(self.watched_variables) > 0:
-            yield Static("Variables being watched:")
-            with Container(id="variable_list"):
-                for var in self.watched_variables:
-                    yield VariableDisplay(var, id=f"vd_{var.replace('.', '-dot-').replace('[', '-lbr-').replace(']', '-rbr-').replace('$', '-ds-')}", var_type=self.all_variables[var])
-        else:
-            yield Static("No variables being watched")
+        yield Static("No variables being watched", id="watch_header")
+        yield DataTable(id="watch_table", cursor_type="row")
+        yield Container(id="watch_detail")
 
         yield Label("Add a variable to watch")
-        yield Input(placeholder="Filter options")
+        yield Input(placeholder="Filter options (or a glob like *rob*.valid, or /regex)")
         yield Select(prompt="Select a variable to add", id="add_var", allow_blank=True, options=self.dropdown_options)
 
+    def watched_names(self):
+        """The watches that are read on every refresh, which leaves out memories (they page themselves in)"""
+
+        return [var for var in self.watched_variables if not is_memory(self.all_variables.get(var, ""))]
+
+    def show_values(self, values, simtime, exact=True) -> None:
+        """Show a watch -> rendered value dict, only touching the rows whose value changed"""
+
+        self.time = (simtime, exact)
+        table = self.query_one("#watch_table", DataTable)
+        for var, text in values.items():
+            if self.values.get(var) == text:
+                continue
+            self.values[var] = text
+            if var in table.rows:
+                table.update_cell(var, "value", value_cell(text))
+            if var == self.selected:
+                self.query_one("#watch_detail .variable_value", Label).update(text)
+        for view in self.query(MemoryView):
+            view.show_time(simtime, exact)
+
+    def _sync_rows(self) -> None:
+        # add and remove table rows until they match the watch list, leaving the rest alone
+        table = self.query_one("#watch_table", DataTable)
+        watched = set(self.watched_variables)
+        for key in list(table.rows):
+            if key.value not in watched:
+                table.remove_row(key)
+                self.values.pop(key.value, None)
+        for var in self.watched_variables:
+            if var not in table.rows:
+                var_type = self.all_variables.get(var, "")
+                if is_memory(var_type):
+                    value = Text("select to browse", style="dim")
+                else:
+                    value = value_cell(self.values.get(var, ""))
+                table.add_row(Text(var), Text(var_type, style="dim"), value, key=var)
+        if self.selected is not None and self.selected not in watched:
+            self.selected = None
+            self.query_one("#watch_detail").remove_children()
+
+        if self.watched_variables:
+            self.query_one("#watch_header", Static).update(f"Variables being watched ({len(self.watched_variables)}):")
+        else:
+            self.query_one("#watch_header", Static).update("No variables being watched")
+
+    def _update_dropdown(self) -> None:
+        # only the best matches of the filter, a Select with every signal in the design is unusable anyway
+        if len(self.index) != len(self.all_variables):
+            self.index = SignalIndex(self.all_variables)
+        query = self.query_one(Input).value
+        self.dropdown_options = [(var, var) for var in self.index.search(query, exclude=set(self.watched_variables))]
+        self.query_one("#add_var").set_options(self.dropdown_options)
+
+    async def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        """Show the details of the watch under the cursor"""
+
+        var = event.row_key.value if event.row_key is not None else None
+        if var is None or var == self.selected:
+            return
+        self.selected = var
+        detail = self.query_one("#watch_detail")
+        await detail.remove_children()
+        await detail.mount(VariableDisplay(var, id=f"vd_{var.replace('.', '-dot-').replace('[', '-lbr-').replace(']', '-rbr-').replace('$', '-ds-')}", var_type=self.all_variables.get(var, "")))
+        if var in self.values:
+            detail.query_one(".variable_value", Label).update(self.values[var])
+        if self.time is not None:
+            for view in detail.query(MemoryView):
+                view.show_time(*self.time)
+
+    def action_break_on_change(self) -> None:
+        """Set a breakpoint on the watch under the cursor changing"""
+
+        if self.selected is not None:
+            self.post_message(self.Break(self.selected))
+
     def on_input_changed(self, event: Input.Changed) -> None:
-        filter_text = event.value.lower()
-        temp_options = [
-            (label, value)
-            for label, value in self.dropdown_options
-            if filter_text in label.lower()
-        ]
-        self.query_one("#add_var").set_options(temp_options)
+        # search once typing pauses instead of on every keystroke
+        if self.search_timer is not None:
+            self.search_timer.stop()
+        self.search_timer = self.set_timer(SEARCH_DEBOUNCE, self._update_dropdown)
 
     def on_variable_display_selected(self, message):
 
-        # TODO: check if in watch list and remove it if so
-
-        var = message.id.split("-button")[0].replace("-dot-", ".").replace("-lbr-", "[").replace("-rbr-", "]").replace("-ds-", "$")
+        var = message.id
 
         if "watching" in Globals().settings:
             watching = Globals().settings["watching"]
         else:
             watching = False
 
-        if watching and var in watching and var in self.watched_variables:
+        if watching and var in watching:
             del watching[var]
-            self.watched_variables.remove(var)
-            self.unused_variables.append(var)
-            self.mutate_reactive(VariableDisplayList.watched_variables)
-            self.mutate_reactive(VariableDisplayList.unused_variables)
             Globals().save_settings()
+        if var in self.watched_variables:
+            self.watched_variables.remove(var)
 
-        if "." in var:
-            var = var.replace(".", "-dot-").replace("[", "-lbr-").replace("]", "-rbr-").replace('$', '-ds-')
-        self.query_one(f"#vd_{var}").remove()
+        self._sync_rows()
 
         # clear input from the filter
         self.query_one(Input).value = ""
 
-        self.dropdown_options = [(var, var) for var in self.unused_variables]
-        self.query_one("#add_var").set_options(self.dropdown_options)
-        self.mutate_reactive(VariableDisplayList.dropdown_options)
-        self.query_one("#add_var").set_options(self.dropdown_options)
+        self._update_dropdown()
 
     async def on_select_changed(self, event) -> None:
         """Add a variable to the watch list."""
@@ -234,18 +319,23 @@ class VariableDisplayList(Widget):
         ):
             return
 
+        self.add_watch(event.value)
+
+    def add_watch(self, var, var_type=None) -> None:
+        """Add a variable to the watch list, even if the full variable list hasn't loaded yet."""
+
         # make sure not already watching
-        if (
-            event.value in self.watched_variables
-            and event.value in self.unused_variables
-        ):
+        if var in self.watched_variables:
             return
 
+        if var not in self.all_variables:
+            self.all_variables[var] = var_type or ""
+
         if "watching" not in Globals().settings:
             Globals().settings["watching"] = {}
-            Globals().settings["watching"][event.value] = ""
-        elif event.value not in Globals().settings["watching"]:
-            Globals().settings["watching"][event.value] = ""
+            Globals().settings["watching"][var] = ""
+        elif var not in Globals().settings["watching"]:
+            Globals().settings["watching"][var] = ""
         else:
             # don't overwrite the value or change settings
             pass
@@ -253,15 +343,62 @@ class VariableDisplayList(Widget):
         # save settings
         Globals().save_settings()
 
-        self.unused_variables.remove(event.value)
-        self.watched_variables.append(event.value)
+        self.watched_variables.append(var)
+
+        self._sync_rows()
+        self._update_dropdown()
+
+
+def value_cell(text, width=VALUE_CELL_WIDTH):
+    """A rendered value squashed onto one table line, the VariableDisplay shows it whole"""
+
+    text = text.rstrip("\n").replace("\n", "  ")
+    if len(text) > width:
+        text = text[:width - 1] + "…"
+    return Text(text)
 
-        self.dropdown_options = [
-            (var, var) for var in self.unused_variables
-        ]
-        self.query_one("#add_var").set_options(self.dropdown_options)
-        self.mutate_reactive(VariableDisplayList.dropdown_options)
-        self.query_one("#add_var").set_options(self.dropdown_options)
 
-        self.mutate_reactive(VariableDisplayList.watched_variables)
-        self.mutate_reactive(VariableDisplayList.unused_variables)
+class VariableTree(Tree):
+    """
+    A browser for the design hierarchy that only lists a scope when it is first expanded,
+    so it is usable as soon as the top level is known instead of after the whole design is listed.
+    """
+
+    class Watch(Message):
+        def __init__(self, var, var_type):
+            self.var = var
+            self.var_type = var_type
+            super().__init__()
+
+    def __init__(self, id=None) -> None:
+        super().__init__("Design", id=id)
+
+    def set_top(self, entries) -> None:
+        """Show the top level of the design, dropping anything listed before."""
+        self.clear()
+        self.add_entries(self.root, entries)
+        self.root.expand()
+
+    def add_entries(self, node, entries) -> None:
+        for name, var_type, is_instance in entries:
+            # names can contain [] from generate blocks and arrays, so never treat them as markup
+            label = name.split(".")[-1]
+            if is_instance:
+                node.add(Text(label, style="bold"), data={"scope": name, "loaded": False})
+            else:
+                node.add_leaf(Text.assemble(label, (f" {var_type}", "dim")), data={"var": name, "type": var_type})
+
+    def on_tree_node_expanded(self, event: Tree.NodeExpanded) -> None:
+        data = event.node.data
+        if data and "scope" in data and not data["loaded"] and Globals().ucli is not None:
+            data["loaded"] = True
+            self.run_worker(self.load_scope(event.node), group="variable_tree")
+
+    async def load_scope(self, node) -> None:
+        entries = await Globals().ucli.list_scope(node.data["scope"])
+        self.add_entries(node, entries)
+
+    def on_tree_node_selected(self, event: Tree.NodeSelected) -> None:
+        data = event.node.data
+        if data and "var" in data:
+            self.post_message(self.Watch(data["var"], data["type"]))